@@ -0,0 +1,320 @@
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import os
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from openai import APIConnectionError, APIStatusError, RateLimitError
+
+from context_window import token_counter
+
+load_dotenv(".env")
+
+# Lower value = served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Azure enforces RPM/TPM over short windows, so buckets hold this many seconds of quota
+BURST_SECONDS = 10
+
+
+class TokenBucket:
+    """Refills at rate_per_minute, holds at most BURST_SECONDS worth"""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * BURST_SECONDS)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be taken (a request larger than the bucket needs a full one)"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        if self.rate <= 0:
+            return
+        self._refill()
+        self.tokens -= amount
+
+
+class Permit:
+    """One admitted LLM call; release() when its response (or stream) is finished"""
+
+    def __init__(self, limiter: "DeploymentLimiter"):
+        self.limiter = limiter
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.limiter._release()
+
+
+class AdmittedStream:
+    """
+    A streamed reply holding its call's permit.
+
+    The generator releases the permit when it finishes, but a generator that
+    is never started never runs its cleanup (e.g. the client disconnected
+    before the response body began), so owners call aclose() when done with
+    the stream either way.
+    """
+
+    def __init__(self, generator, permit: Optional[Permit]):
+        self.generator = generator
+        self.permit = permit
+
+    def __aiter__(self):
+        return self.generator.__aiter__()
+
+    async def aclose(self):
+        try:
+            await self.generator.aclose()
+        finally:
+            if self.permit:
+                self.permit.release()
+
+
+class DeploymentLimiter:
+    """
+    Admission for one Azure OpenAI deployment.
+
+    A call is admitted when the RPM and TPM buckets both have room and fewer
+    than max_concurrent calls are in flight. Waiters are served by priority
+    (interactive before background), then arrival. Each priority has its own
+    bounded queue and maximum wait; past either the call is rejected with
+    503 and a Retry-After estimate. A 429 from Azure pauses the deployment
+    for everyone until its retry time has passed.
+    """
+
+    def __init__(self, name: str, rpm: int, tpm: int, max_concurrent: int,
+                 max_queue: Dict[int, int], max_wait: Dict[int, float]):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.token_bucket = TokenBucket(tpm)
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.waiters: List[Tuple[int, int]] = []
+        self.waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.sequence = itertools.count()
+        self.changed = asyncio.Condition()
+        self.counters = {"admitted": 0, "rejected": 0, "rate_limited": 0, "retries": 0, "wait_seconds": 0.0}
+
+    def _wait_time(self, tokens: int) -> float:
+        waits = [self.requests.wait_time(1), self.token_bucket.wait_time(tokens), self.paused_until - time.monotonic()]
+        return max(0.0, *waits)
+
+    def _reject(self, retry_after: float):
+        self.counters["rejected"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail=f"LLM deployment {self.name} is busy",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    async def acquire(self, tokens: int, priority: int = INTERACTIVE) -> Permit:
+        if self.waiting[priority] >= self.max_queue[priority]:
+            self._reject(self._wait_time(tokens) or 1)
+
+        entry = (priority, next(self.sequence))
+        heapq.heappush(self.waiters, entry)
+        self.waiting[priority] += 1
+        started = time.monotonic()
+        deadline = started + self.max_wait[priority]
+        try:
+            async with self.changed:
+                while True:
+                    wait = None
+                    if self.waiters[0] == entry and self.in_flight < self.max_concurrent:
+                        wait = self._wait_time(tokens)
+                        if wait == 0:
+                            self.requests.take(1)
+                            self.token_bucket.take(tokens)
+                            self.in_flight += 1
+                            self.counters["admitted"] += 1
+                            self.counters["wait_seconds"] += time.monotonic() - started
+                            return Permit(self)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or (wait is not None and wait > remaining):
+                        self._reject(wait or 1)
+                    try:
+                        await asyncio.wait_for(self.changed.wait(), min(remaining, wait or remaining))
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            self.waiters.remove(entry)
+            heapq.heapify(self.waiters)
+            self.waiting[priority] -= 1
+            await self._notify()
+
+    async def _notify(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+    def _release(self):
+        self.in_flight -= 1
+        asyncio.ensure_future(self._notify())
+
+    def pause(self, seconds: float):
+        self.counters["rate_limited"] += 1
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "in_flight": self.in_flight,
+            "max_concurrent": self.max_concurrent,
+            "waiting_interactive": self.waiting[INTERACTIVE],
+            "waiting_background": self.waiting[BACKGROUND],
+            "paused_for": max(0.0, self.paused_until - time.monotonic()),
+            "request_tokens": self.requests.tokens,
+            "tpm_tokens": self.token_bucket.tokens
+        }
+
+
+class AdmissionController:
+    """
+    Admission control for every Azure OpenAI call, one limiter per deployment.
+
+    create() estimates the call's tokens (prompt + max_tokens, which is how
+    Azure counts TPM), waits for admission and retries 429s with jittered
+    exponential backoff (or Azure's retry-after). Other transient failures
+    (connection errors and timeouts, 408, 409, 5xx) get the same retries,
+    since the SDK's own retries are turned off. Limits come from LLM_RPM,
+    LLM_TPM and LLM_MAX_CONCURRENT, overridden per deployment through
+    LLM_DEPLOYMENT_LIMITS, e.g. {"gpt-4o": {"rpm": 300, "tpm": 50000}}.
+    """
+
+    def __init__(self, rpm: int, tpm: int, max_concurrent: int, max_queue: Dict[int, int],
+                 max_wait: Dict[int, float], retries: int = 3, backoff_base: float = 1.0,
+                 backoff_max: float = 30.0, overrides: Optional[Dict[str, Dict]] = None):
+        self.defaults = {"rpm": rpm, "tpm": tpm, "max_concurrent": max_concurrent}
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.overrides = overrides or {}
+        self.limiters: Dict[str, DeploymentLimiter] = {}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            rpm=int(os.getenv("LLM_RPM", "0")),
+            tpm=int(os.getenv("LLM_TPM", "0")),
+            max_concurrent=int(os.getenv("LLM_MAX_CONCURRENT", "50")),
+            max_queue={
+                INTERACTIVE: int(os.getenv("LLM_QUEUE_INTERACTIVE", "100")),
+                BACKGROUND: int(os.getenv("LLM_QUEUE_BACKGROUND", "500"))
+            },
+            max_wait={
+                INTERACTIVE: float(os.getenv("LLM_WAIT_INTERACTIVE", "10")),
+                BACKGROUND: float(os.getenv("LLM_WAIT_BACKGROUND", "300"))
+            },
+            retries=int(os.getenv("LLM_429_RETRIES", "3")),
+            backoff_base=float(os.getenv("LLM_BACKOFF_BASE", "1")),
+            backoff_max=float(os.getenv("LLM_BACKOFF_MAX", "30")),
+            overrides=json.loads(os.getenv("LLM_DEPLOYMENT_LIMITS", "{}"))
+        )
+
+    def limiter(self, deployment: str) -> DeploymentLimiter:
+        limiter = self.limiters.get(deployment)
+        if limiter is None:
+            limits = {**self.defaults, **self.overrides.get(deployment, {})}
+            limiter = DeploymentLimiter(deployment, limits["rpm"], limits["tpm"], limits["max_concurrent"],
+                                        self.max_queue, self.max_wait)
+            self.limiters[deployment] = limiter
+        return limiter
+
+    @staticmethod
+    def _transient(error: Exception) -> bool:
+        """Failures the SDK would have retried (429s are handled separately)"""
+        if isinstance(error, APIConnectionError):
+            # Includes APITimeoutError
+            return True
+        status = getattr(error, "status_code", None)
+        return status in (408, 409) or (status is not None and status >= 500)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after-ms")) / 1000
+            except (TypeError, ValueError):
+                try:
+                    retry_after = float(response.headers.get("retry-after"))
+                except (TypeError, ValueError):
+                    pass
+        if retry_after is None:
+            retry_after = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        # Full jitter on top, so callers that hit the limit together do not retry together
+        return retry_after + random.uniform(0, retry_after)
+
+    async def create(self, client, model: str, messages: List[Dict[str, str]], max_tokens: int,
+                     priority: int = INTERACTIVE, **kwargs):
+        """
+        chat.completions.create through admission control.
+
+        Returns (response, permit). For streams release the permit when the
+        stream is finished; otherwise it can be released right away.
+        """
+        limiter = self.limiter(model)
+        tokens = sum(token_counter.count_message(m) for m in messages) + max_tokens
+        attempt = 0
+        while True:
+            permit = await limiter.acquire(tokens, priority)
+            try:
+                response = await client.chat.completions.create(
+                    model=model, messages=messages, max_tokens=max_tokens, **kwargs
+                )
+                return response, permit
+            except RateLimitError as e:
+                permit.release()
+                if attempt >= self.retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                limiter.pause(delay)
+                limiter.counters["retries"] += 1
+                attempt += 1
+                print(f"Azure OpenAI 429 on {model}, retrying in {delay:.1f}s")
+            except (APIConnectionError, APIStatusError) as e:
+                permit.release()
+                if not self._transient(e) or attempt >= self.retries:
+                    raise
+                # Only this call backs off; the deployment itself is not rate limited
+                delay = self._backoff(attempt, e)
+                limiter.counters["retries"] += 1
+                attempt += 1
+                print(f"Azure OpenAI error on {model} ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            except BaseException:
+                permit.release()
+                raise
+
+    def stats(self) -> Dict:
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
+
+
+admission = AdmissionController.from_env()
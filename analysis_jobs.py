@@ -0,0 +1,190 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from admission import BACKGROUND
+from mongo import MongoDB
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class AnalysisJobQueue:
+    """
+    Background session analysis on a MongoDB-backed job queue.
+
+    Jobs live in the analysis_jobs collection so every worker process can
+    claim them and a restart loses nothing. Each process runs `workers`
+    asyncio workers, which bounds the concurrent analyses it sends to the
+    LLM. A job is claimed atomically with find_one_and_update; jobs left
+    running by a crashed worker for longer than `job_timeout` are put back in
+    the queue until they reach `max_attempts`.
+
+    A session has at most one queued or running job (partial unique index on
+    session_id where active is true); enqueueing it again returns that job.
+    The analysis itself goes through SessionAnalysisService, so a job for a
+    session whose report is still current finishes without calling the LLM.
+    """
+
+    def __init__(self, db: MongoDB, analysis_service, workers: int = 2, poll_interval: float = 5.0,
+                 job_timeout: float = 600.0, max_attempts: int = 3):
+        self.jobs = db.db.analysis_jobs
+        self.analysis_service = analysis_service
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.max_attempts = max_attempts
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.wakeup = asyncio.Event()
+        self.tasks: List[asyncio.Task] = []
+        self.counters = {"enqueued": 0, "done": 0, "failed": 0, "retried": 0, "reclaimed": 0}
+
+    @classmethod
+    def from_env(cls, db: MongoDB, analysis_service) -> "AnalysisJobQueue":
+        return cls(
+            db,
+            analysis_service,
+            workers=int(os.getenv("ANALYSIS_WORKERS", "2")),
+            poll_interval=float(os.getenv("ANALYSIS_POLL_INTERVAL", "5")),
+            job_timeout=float(os.getenv("ANALYSIS_JOB_TIMEOUT", "600")),
+            max_attempts=int(os.getenv("ANALYSIS_MAX_ATTEMPTS", "3"))
+        )
+
+    @staticmethod
+    def _public(job: Optional[dict]) -> Optional[dict]:
+        if job:
+            job.pop("_id", None)
+            job.pop("active", None)
+        return job
+
+    async def enqueue(self, session_id: str, source: str = "api") -> dict:
+        """Queue an analysis of the session, or return its queued/running job"""
+        now = datetime.now()
+        job_id = str(uuid.uuid4())
+        try:
+            job = await self.jobs.find_one_and_update(
+                {"session_id": session_id, "active": True},
+                {"$setOnInsert": {
+                    "job_id": job_id,
+                    "status": QUEUED,
+                    "source": source,
+                    "attempts": 0,
+                    "created_at": now,
+                    "updated_at": now
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another worker inserted the active job for this session first
+            job = await self.jobs.find_one({"session_id": session_id, "active": True})
+        if job and job["job_id"] == job_id:
+            self.counters["enqueued"] += 1
+            self.wakeup.set()
+        return self._public(job)
+
+    async def enqueue_many(self, session_ids: List[str], source: str = "batch") -> List[dict]:
+        jobs = []
+        for session_id in dict.fromkeys(session_ids):
+            jobs.append(await self.enqueue(session_id, source))
+        return jobs
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        return self._public(await self.jobs.find_one({"job_id": job_id}))
+
+    def start(self):
+        for _ in range(self.workers):
+            self.tasks.append(asyncio.create_task(self._work()))
+
+    async def stop(self):
+        """Stop claiming; jobs interrupted here are reclaimed after job_timeout"""
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.now()
+        return await self.jobs.find_one_and_update(
+            {"status": QUEUED},
+            {"$set": {"status": RUNNING, "worker": self.worker_id, "started_at": now, "updated_at": now},
+             "$inc": {"attempts": 1}},
+            sort=[("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _reclaim_stale(self):
+        cutoff = datetime.now() - timedelta(seconds=self.job_timeout)
+        stale = {"status": RUNNING, "started_at": {"$lt": cutoff}}
+        await self.jobs.update_many(
+            {**stale, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {"status": FAILED, "error": "Timed out", "updated_at": datetime.now()},
+             "$unset": {"active": ""}}
+        )
+        result = await self.jobs.update_many(stale, {"$set": {"status": QUEUED, "updated_at": datetime.now()}})
+        self.counters["reclaimed"] += result.modified_count
+
+    async def _finish(self, job: dict, update: dict, active: bool = False):
+        update = {"$set": {**update, "updated_at": datetime.now()}}
+        if not active:
+            update["$unset"] = {"active": ""}
+        await self.jobs.update_one({"job_id": job["job_id"], "worker": self.worker_id}, update)
+
+    async def _run(self, job: dict):
+        try:
+            report = await self.analysis_service.get_analysis(job["session_id"], BACKGROUND)
+        except Exception as e:
+            print(f"Error analysing session {job['session_id']}: {e}")
+            if job["attempts"] < self.max_attempts:
+                self.counters["retried"] += 1
+                await self._finish(job, {"status": QUEUED, "error": str(e)}, active=True)
+            else:
+                self.counters["failed"] += 1
+                await self._finish(job, {"status": FAILED, "error": str(e), "finished_at": datetime.now()})
+            return
+
+        if report is None:
+            self.counters["failed"] += 1
+            await self._finish(job, {"status": FAILED, "error": "Session not found", "finished_at": datetime.now()})
+            return
+
+        self.counters["done"] += 1
+        await self._finish(job, {
+            "status": DONE,
+            "error": None,
+            "conversation_id": report.conversation_id,
+            "overall_score": report.overall_score,
+            "message_count": report.message_count,
+            "finished_at": datetime.now()
+        })
+
+    async def _work(self):
+        while True:
+            try:
+                job = await self._claim()
+                if job is None:
+                    await self._reclaim_stale()
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                print(f"Error in analysis worker: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def stats(self) -> Dict:
+        counts = {}
+        async for row in self.jobs.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        return {**self.counters, "workers": len(self.tasks), "jobs": counts}
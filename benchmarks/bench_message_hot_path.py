@@ -0,0 +1,103 @@
+"""
+CPU cost per chat turn of turning a stored session into models and writing the new message.
+
+validated: ChatSession(**doc) on the read, message.dict() / session.dict() on the write
+           (what every turn did before).
+construct: model_construct for the session and every message on the read (no
+           validation, but Python-level), message_document on the write.
+hot path:  session_from_document (one model_validate call) on the read and
+           message_document on the write (what mongo.py does now).
+view:      the same for a SessionView of the last 40 messages (/gt/api/chat/stream).
+
+The documents are what motor returns for a session of 10, 100 and 1000
+messages. No database is needed.
+
+    python benchmarks/bench_message_hot_path.py
+"""
+import os
+import sys
+import timeit
+import uuid
+import warnings
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from models import ChatSession, Message, SessionView, message_document, session_from_document
+
+SAMPLE_TEXT = "This is a typical role-play turn of a few sentences. " * 4
+VIEW_MESSAGES = 40
+
+
+def session_document(messages: int) -> dict:
+    return {
+        "_id": str(uuid.uuid4()),
+        "extra": str(uuid.uuid4()),
+        "session_id": str(uuid.uuid4()),
+        "scenario_name": "benchmark",
+        "conversation_history": [
+            {"role": "user" if i % 2 else "assistant", "content": SAMPLE_TEXT, "timestamp": datetime.now()}
+            for i in range(messages)
+        ],
+        "created_at": datetime.now(),
+        "last_updated": datetime.now()
+    }
+
+
+def validated_turn(doc: dict):
+    session = ChatSession(**doc)
+    message = Message(role="assistant", content=SAMPLE_TEXT, timestamp=datetime.now())
+    session.conversation_history.append(message)
+    message.dict()
+    session.dict()
+
+
+def construct_turn(doc: dict):
+    session = ChatSession.model_construct(
+        extra=doc["extra"],
+        session_id=doc["session_id"],
+        scenario_name=doc["scenario_name"],
+        conversation_history=[Message.model_construct(**m) for m in doc["conversation_history"]],
+        created_at=doc["created_at"],
+        last_updated=doc["last_updated"]
+    )
+    message = Message.model_construct(role="assistant", content=SAMPLE_TEXT, timestamp=datetime.now())
+    session.conversation_history.append(message)
+    message_document(message)
+
+
+def hot_path_turn(doc: dict):
+    session = session_from_document(doc)
+    message = Message(role="assistant", content=SAMPLE_TEXT, timestamp=datetime.now())
+    session.conversation_history.append(message)
+    message_document(message)
+
+
+def view_turn(doc: dict):
+    history = doc["conversation_history"][-VIEW_MESSAGES:]
+    SessionView.model_validate({
+        "session_id": doc["session_id"],
+        "scenario_name": doc["scenario_name"],
+        "conversation_history": history,
+        "history_offset": len(doc["conversation_history"]) - len(history),
+        "message_count": len(doc["conversation_history"])
+    })
+    message = Message(role="assistant", content=SAMPLE_TEXT, timestamp=datetime.now())
+    message_document(message)
+
+
+def main():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    print(f"{'messages':>9} {'validated us':>13} {'construct us':>13} {'hot path us':>12} {'view us':>9} {'speedup':>8}")
+    for messages in (10, 100, 1000):
+        doc = session_document(messages)
+        number = max(20, 20000 // messages)
+        results = []
+        for turn in (validated_turn, construct_turn, hot_path_turn, view_turn):
+            seconds = min(timeit.repeat(lambda: turn(doc), number=number, repeat=5))
+            results.append(seconds / number * 1e6)
+        validated, construct, hot_path, view = results
+        print(f"{messages:>9} {validated:>13.1f} {construct:>13.1f} {hot_path:>12.1f} {view:>9.1f} {validated / hot_path:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
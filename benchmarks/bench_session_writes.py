@@ -0,0 +1,50 @@
+"""
+Write size per chat turn: full-document $set vs. append-only $push.
+
+Encodes the update documents that MongoDB.update_session and
+MongoDB.append_messages send for a growing conversation and prints the
+BSON bytes of each turn's write. No database is needed.
+
+    python benchmarks/bench_session_writes.py
+"""
+import os
+import sys
+import uuid
+from datetime import datetime
+
+import bson
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from models import ChatSession, Message
+
+SAMPLE_TEXT = "This is a typical role-play turn of a few sentences. " * 4
+
+
+def main():
+    session = ChatSession(
+        extra=str(uuid.uuid4()),
+        session_id=str(uuid.uuid4()),
+        scenario_name="benchmark",
+        conversation_history=[]
+    )
+    print(f"{'turn':>6} {'$set bytes':>12} {'$push bytes':>12} {'$set total':>12} {'$push total':>12}")
+    set_total = push_total = 0
+    for turn in range(1, 1001):
+        message = Message(role="user" if turn % 2 else "assistant", content=SAMPLE_TEXT, timestamp=datetime.now())
+        session.conversation_history.append(message)
+
+        set_update = {"$set": session.dict()}
+        push_update = {
+            "$push": {"conversation_history": {"$each": [message.dict()]}},
+            "$set": {"last_updated": datetime.now()}
+        }
+        set_bytes = len(bson.encode(set_update))
+        push_bytes = len(bson.encode(push_update))
+        set_total += set_bytes
+        push_total += push_bytes
+        if turn in (1, 10, 100, 250, 500, 1000):
+            print(f"{turn:>6} {set_bytes:>12} {push_bytes:>12} {set_total:>12} {push_total:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,29 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional, AsyncGenerator
+from typing import Dict, List, Optional, AsyncGenerator, Tuple
 from datetime import datetime
-from openai import AsyncAzureOpenAI
+from openai import AsyncAzureOpenAI, BadRequestError
+from fastapi import HTTPException
+from pydantic import ValidationError
+import json
 import os
-from models import Message, BotConfig, BotConfigAnalyser
+import re
+from models import Message, BotConfig, BotConfigAnalyser, ChatReport
+from stream_tags import NameTagReplacer
+from context_window import ContextWindow, summary_message
+from admission import admission, AdmittedStream, INTERACTIVE
+from prompt_cache import FormattedHistoryCache, FORMATTED_HISTORY_SESSIONS, prompt_cache_stats
+
+try:
+    from jsonschema import Draft7Validator
+    from jsonschema.exceptions import SchemaError
+except ImportError:  # bot_schema is then only enforced through response_format
+    Draft7Validator = None
+    SchemaError = Exception
+
+
+def is_json_schema(schema: Dict) -> bool:
+    """True for a JSON Schema, False for an example of the expected object"""
+    return isinstance(schema, dict) and (schema.get("type") == "object" or isinstance(schema.get("properties"), dict))
 
 class BaseLLMBot(ABC):
     """Base class for all LLM-powered bots using Azure OpenAI"""
@@ -17,126 +37,187 @@ class BaseLLMBot(ABC):
         self.llm_model = config.llm_model
         self.llm_client = llm_client
         self.last_used = datetime.now()
+        self.context_window = ContextWindow.from_env()
+        self.history_cache = FormattedHistoryCache(FORMATTED_HISTORY_SESSIONS)
+        # Fixed context for the prompt prefix; load_scenarios may set it before compile_prompt
+        self.scenario_context = ""
+        self.compile_prompt()
         
         # Database connection (to be set by factory)
         self.db = None
     
-    async def format_conversation(self, conversation_history: List[Message]) -> List[Dict[str, str]]:
-        """Format conversation history for the LLM"""
-        contents = []
-        
-        print(f"🔍 DEBUG: conversation_history length = {len(conversation_history)}")
-        
-        
-        # Add system prompt
-        system_content = self.config.system_prompt
-        
-        contents.append({"role": "system", "content": system_content})
-        print(f"🔍 DEBUG: Final system prompt length = {len(system_content)}")
-        print(f"🔍 DEBUG: Last 200 chars of system prompt: ")
-        
-        # Add conversation history
-        for message in conversation_history:
-            role = "user" if message.role == self.config.bot_role_alt else "assistant"
-            content = {
-                "role": role,
-                "content": message.content
-            }
-            contents.append(content)
-            
-        return contents
+    def compile_prompt(self):
+        """
+        Build the fixed prompt prefix once: system prompt plus any scenario
+        context set by load_scenarios. It is identical on every request, so
+        Azure can serve it from the prompt cache.
+        """
+        content = self.config.system_prompt
+        if self.scenario_context:
+            content = f"{content}\n\n{self.scenario_context}"
+        self.prefix = [{"role": "system", "content": content}]
+
+    def system_messages(self, summary: Optional[str] = None) -> List[Dict[str, str]]:
+        """Prompt prefix, plus the rolling summary of turns no longer sent"""
+        if summary:
+            return self.prefix + [summary_message(summary)]
+        return list(self.prefix)
+
+    def format_message(self, message: Message) -> Dict[str, str]:
+        return {
+            "role": "user" if message.role == self.bot_role_alt else "assistant",
+            "content": message.content
+        }
+
+    def history_messages(self, conversation_history: List[Message], session_id: Optional[str] = None,
+                         history_offset: int = 0) -> List[Dict[str, str]]:
+        return self.history_cache.get(session_id, conversation_history, self.format_message, history_offset)
+
+    async def format_conversation(self, conversation_history: List[Message], summary: Optional[str] = None,
+                                  summary_upto: int = 0, session_id: Optional[str] = None,
+                                  history_offset: int = 0) -> List[Dict[str, str]]:
+        """
+        Format conversation history for the LLM.
+
+        conversation_history may be the tail of the session, starting at
+        message history_offset. With a summary, the first summary_upto
+        messages of the session are replaced by it. The result is not
+        trimmed; process_message fits it to the token budget.
+        """
+        history = self.history_messages(conversation_history, session_id, history_offset)
+        if summary:
+            history = history[max(0, summary_upto - history_offset):]
+        return self.system_messages(summary) + history
 
     def replace_name(self, text: str, name: str) -> str:
         """Replace placeholder with actual name"""
         return text.replace("[NAME]", name) if name else text
     
-    async def _process_normal_stream(self, response, name: Optional[str]):
-        """Process normal streaming response"""
+    async def _process_normal_stream(self, response, name: Optional[str], permit=None):
+        """
+        Process normal streaming response.
+
+        Every event carries the new text in "delta" and the reply so far in
+        "chunk"; [NAME] is replaced on each delta instead of the whole text.
+        """
         async def normal_generator():
             full_response = ""
+            replacer = NameTagReplacer(name)
             
-            async for chunk in response:
-                if len(chunk.choices) > 0:
-                    chunk_text = chunk.choices[0].delta.content
-                    finish_reason = chunk.choices[0].finish_reason
+            try:
+                async for chunk in response:
+                    if len(chunk.choices) > 0:
+                        chunk_text = chunk.choices[0].delta.content
+                        finish_reason = chunk.choices[0].finish_reason
                     
-                    if chunk_text:
-                        full_response += chunk_text
-                        
-                        # Apply name replacement
-                        if name:
-                            updated_text = self.replace_name(full_response, name)
-                        else:
-                            updated_text = full_response
-                        
-                        yield {"chunk": updated_text, "finish": None, "usage": None}
+                        if chunk_text:
+                            delta = replacer.feed(chunk_text)
+                            full_response += delta
+                            yield {"chunk": full_response, "delta": delta, "finish": None, "usage": None}
                     
-                    if finish_reason == "stop":
-                        if name:
-                            final_text = self.replace_name(full_response, name)
-                        else:
-                            final_text = full_response
-                        
-                        yield {"chunk": final_text, "finish": "stop", "usage": None}
+                        if finish_reason == "stop":
+                            delta = replacer.flush()
+                            full_response += delta
+                            yield {"chunk": full_response, "delta": delta, "finish": "stop", "usage": None}
                 
-                # Handle usage statistics
-                if hasattr(chunk, 'usage') and chunk.usage:
-                    yield {
-                        "chunk": full_response,
-                        "finish": "stop", 
-                        "usage": {
-                            "completion_tokens": chunk.usage.completion_tokens,
-                            "prompt_tokens": chunk.usage.prompt_tokens,
-                            "total_tokens": chunk.usage.total_tokens
+                    # Handle usage statistics
+                    if hasattr(chunk, 'usage') and chunk.usage:
+                        delta = replacer.flush()
+                        full_response += delta
+                        details = getattr(chunk.usage, "prompt_tokens_details", None)
+                        cached_tokens = getattr(details, "cached_tokens", None) or 0
+                        prompt_cache_stats.record(self.bot_name, chunk.usage.prompt_tokens, cached_tokens)
+                        yield {
+                            "chunk": full_response,
+                            "delta": delta,
+                            "finish": "stop", 
+                            "usage": {
+                                "completion_tokens": chunk.usage.completion_tokens,
+                                "prompt_tokens": chunk.usage.prompt_tokens,
+                                "cached_tokens": cached_tokens,
+                                "total_tokens": chunk.usage.total_tokens
+                            }
                         }
-                    }
+            finally:
+                # Frees this call's admission slot however the stream ends
+                if permit:
+                    permit.release()
         
-        return normal_generator()
+        return AdmittedStream(normal_generator(), permit)
 
-    async def process_message(self, message: str, conversation_history: List[Message], name: Optional[str] = None) -> AsyncGenerator:
+    async def process_message(self, message: str, conversation_history: List[Message], name: Optional[str] = None,
+                              summary: Optional[str] = None, summary_upto: int = 0,
+                              session_id: Optional[str] = None, history_offset: int = 0) -> AsyncGenerator:
         """Enhanced process_message with Azure OpenAI client"""
         self.last_used = datetime.now()
         
-        # Format conversation for LLM
-        contents = await self.format_conversation(conversation_history)
+        # Format conversation for LLM, keeping the most recent turns within the token budget
+        contents = await self.format_conversation(conversation_history, summary, summary_upto, session_id,
+                                                  history_offset)
         contents.append({"role": "user", "content": message})
+        system_count = next((i for i, m in enumerate(contents) if m["role"] != "system"), len(contents))
+        # Messages left out are counted in the context window stats (/gt/api/admin/context-window)
+        contents, _ = self.context_window.fit(contents[:system_count], contents[system_count:])
         
         try:
-            # Get streaming response from Azure OpenAI
-            response = await self.llm_client.chat.completions.create(
-                model=self.llm_model,
-                messages=contents,
+            # Get streaming response from Azure OpenAI (admitted ahead of background work)
+            response, permit = await admission.create(
+                self.llm_client,
+                self.llm_model,
+                contents,
+                max_tokens=1000,
+                priority=INTERACTIVE,
                 temperature=0.7,
                 top_p=0.95,
-                max_tokens=1000,
                 stream=True,
                 stream_options={"include_usage": True}
             )
             
-            return await self._process_normal_stream(response, name)
+            return await self._process_normal_stream(response, name, permit)
                     
+        except HTTPException:
+            # Saturated: 503 + Retry-After to the client
+            raise
         except Exception as e:
             print(f"Error in process_message: {e}")
             async def error_generator():
+                error_text = f"Error processing message: {str(e)}"
                 yield {
-                    "chunk": f"Error processing message: {str(e)}",
+                    "chunk": error_text,
+                    "delta": error_text,
                     "finish": "stop",
                     "usage": None
                 }
             return error_generator()
 
     
-    async def get_farmer_response(self, message: str, scenario_name: str, conversation_history: List[Message]) -> str:
+    async def get_farmer_response(self, message: str, scenario_name: str, conversation_history: List[Message],
+                                  summary: Optional[str] = None, summary_upto: int = 0,
+                                  session_id: Optional[str] = None) -> str:
         """Get response from the bot"""
         final_response = ""
-        async for chunk_data in await self.process_message(message, conversation_history):
+        async for chunk_data in await self.process_message(message, conversation_history, summary=summary,
+                                                           summary_upto=summary_upto, session_id=session_id):
             if isinstance(chunk_data, dict):
                 final_response = chunk_data.get("chunk", "")
         return final_response
 
 
+class AnalysisError(Exception):
+    """The analyser LLM did not produce a usable report"""
+
+
 class BaseAnalyserBot(ABC):
-    """Base class for analyzer bots using Azure OpenAI"""
+    """
+    Base class for analyzer bots using Azure OpenAI.
+
+    bot_schema is either a JSON Schema (has "type"/"properties") or an example
+    of the expected object. A JSON Schema is sent as a json_schema response
+    format and compiled into a validator once, when the bot is built; an
+    example is put in the prompt and the reply is constrained to a JSON object.
+    Either way the reply must also hold the fields a ChatReport needs, and a
+    reply that does not gets one corrective retry before AnalysisError.
+    """
     
     def __init__(self, config: BotConfigAnalyser, llm_client: AsyncAzureOpenAI):
         self.config = config
@@ -147,58 +228,135 @@ class BaseAnalyserBot(ABC):
         self.llm_model = config.llm_model
         self.llm_client = llm_client
         self.last_used = datetime.now()
+        self.is_json_schema = is_json_schema(self.bot_schema)
+        self.response_format = self._response_format()
+        self.validator = self._compile_validator()
         
         # Database connection (to be set by factory)
         self.db = None
-    
-    async def analyze_conversation(self, conversation: Dict) -> Dict:
-        """Analyze conversation using Azure OpenAI"""
+
+    def _response_format(self) -> Dict:
+        if not self.is_json_schema:
+            return {"type": "json_object"}
+        name = re.sub(r"[^a-zA-Z0-9_-]", "_", self.bot_name)[:64] or "analysis"
+        # Not strict: stored schemas do not all meet strict mode's rules
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": self.bot_schema, "strict": False}}
+
+    def _compile_validator(self):
+        if not self.is_json_schema or Draft7Validator is None:
+            return None
         try:
-            # Format conversation for analysis
-            conversation_text = self._format_conversation_for_analysis(conversation)
-            
-            # Create analysis prompt
-            analysis_prompt = f"""
+            Draft7Validator.check_schema(self.bot_schema)
+            return Draft7Validator(self.bot_schema)
+        except SchemaError as e:
+            print(f"Invalid bot_schema for analyser {self.bot_name}: {e.message}")
+            return None
+
+    def _analysis_messages(self, conversation_text: str) -> List[Dict[str, str]]:
+        schema_text = json.dumps(self.bot_schema, indent=2)
+        analysis_prompt = f"""
             {self.system_prompt}
             
             Please analyze the following conversation and provide structured feedback based on the schema:
             {conversation_text}
             
-            Respond with a JSON object matching the required schema.
-            """
+            Respond with a JSON object matching the required schema:
+            {schema_text}
             
-            response = await self.llm_client.chat.completions.create(
-                model=self.llm_model,
-                messages=[
-                    {"role": "system", "content": "You are an expert conversation analyzer."},
-                    {"role": "user", "content": analysis_prompt}
-                ],
+            The object must include overall_score (number), category_scores (object of numbers),
+            detailed_feedback (object of string lists) and recommendations (list of strings).
+            """
+        return [
+            {"role": "system", "content": "You are an expert conversation analyzer."},
+            {"role": "user", "content": analysis_prompt}
+        ]
+
+    async def _complete(self, messages: List[Dict[str, str]], priority: int = INTERACTIVE) -> str:
+        """Stream the reply and return the full text; a truncated reply is an error"""
+        try:
+            stream, permit = await admission.create(
+                self.llm_client,
+                self.llm_model,
+                messages,
+                max_tokens=2000,
+                priority=priority,
                 temperature=0.3,
-                max_tokens=2000
+                response_format=self.response_format,
+                stream=True
             )
-            
-            # Parse response and return structured analysis
-            analysis_text = response.choices[0].message.content
-            # Parse JSON response based on bot_schema
-            import json
-            try:
-                analysis_result = json.loads(analysis_text)
-                return analysis_result
-            except json.JSONDecodeError:
-                # Fallback if JSON parsing fails
-                return {
-                    "analysis": analysis_text,
-                    "category_scores": {},
-                    "overall_score": 0
-                }
-                
-        except Exception as e:
-            print(f"Error in analyze_conversation: {e}")
-            return {
-                "error": str(e),
-                "category_scores": {},
-                "overall_score": 0
-            }
+        except BadRequestError as e:
+            if self.response_format["type"] != "json_schema":
+                raise
+            # Older deployments / API versions do not support json_schema
+            print(f"json_schema response format rejected for {self.bot_name}, using json_object: {e}")
+            self.response_format = {"type": "json_object"}
+            return await self._complete(messages, priority)
+
+        parts = []
+        finish_reason = None
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta and choice.delta.content:
+                    parts.append(choice.delta.content)
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+        finally:
+            permit.release()
+        text = "".join(parts)
+        if finish_reason == "length":
+            raise AnalysisError("Analysis was cut off at max_tokens")
+        return text
+
+    def _validate(self, text: str) -> Tuple[Optional[Dict], List[str]]:
+        """The parsed reply and the problems that stop it from becoming a ChatReport"""
+        try:
+            result = json.loads(text)
+        except json.JSONDecodeError as e:
+            return None, [f"Reply is not valid JSON: {e}"]
+        if not isinstance(result, dict):
+            return None, ["Reply must be a JSON object"]
+
+        errors = []
+        if self.validator is not None:
+            errors.extend(
+                f"{'/'.join(str(p) for p in error.absolute_path) or '(root)'}: {error.message}"
+                for error in self.validator.iter_errors(result)
+            )
+        try:
+            ChatReport(session_id="", conversation_id="", **result)
+        except (ValidationError, TypeError) as e:
+            errors.append(str(e))
+        return result, errors[:10]
+
+    async def analyze_conversation(self, conversation: Dict, priority: int = INTERACTIVE) -> Dict:
+        """
+        Analyze conversation using Azure OpenAI; raises AnalysisError when no usable report comes back.
+
+        priority: INTERACTIVE when someone waits on the report, BACKGROUND for queued jobs.
+        """
+        conversation_text = self._format_conversation_for_analysis(conversation)
+        messages = self._analysis_messages(conversation_text)
+
+        text = await self._complete(messages, priority)
+        result, errors = self._validate(text)
+        if not errors:
+            return result
+
+        # One corrective retry with the problems spelled out
+        print(f"Analysis from {self.bot_name} invalid, retrying: {errors}")
+        messages = messages + [
+            {"role": "assistant", "content": text},
+            {"role": "user", "content": "The JSON above is not valid for the schema:\n- " + "\n- ".join(errors)
+                + "\nReturn the corrected JSON object only."}
+        ]
+        text = await self._complete(messages, priority)
+        result, errors = self._validate(text)
+        if errors:
+            raise AnalysisError(f"Invalid analysis from {self.bot_name}: {errors}")
+        return result
     
     def _format_conversation_for_analysis(self, conversation: Dict) -> str:
         """Format conversation history for analysis"""
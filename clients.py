@@ -0,0 +1,180 @@
+import os
+import threading
+from typing import Dict, Optional
+
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+from openai import AsyncAzureOpenAI
+from pymongo import monitoring
+from dotenv import load_dotenv
+
+load_dotenv(".env")
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Azure OpenAI HTTP pool
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1") == "1" and HTTP2_AVAILABLE
+# 429s and other transient errors are retried by admission.py (which also pauses the deployment on 429s);
+# SDK retries would double up
+LLM_SDK_MAX_RETRIES = int(os.getenv("LLM_SDK_MAX_RETRIES", "0"))
+
+# MongoDB pool
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Counts connection pool events of the shared motor client"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {
+            "created": 0,
+            "closed": 0,
+            "in_use": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "pool_cleared": 0
+        }
+
+    def _add(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] += value
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add("pool_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add("created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add("closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._add("checkout_failures")
+
+    def connection_checked_out(self, event):
+        self._add("in_use")
+        self._add("checkouts")
+
+    def connection_checked_in(self, event):
+        self._add("in_use", -1)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                **self.counters,
+                "open": self.counters["created"] - self.counters["closed"],
+                "max_pool_size": MONGO_MAX_POOL_SIZE
+            }
+
+
+_http_client: Optional[httpx.AsyncClient] = None
+_llm_client: Optional[AsyncAzureOpenAI] = None
+_motor_clients: Dict[str, AsyncIOMotorClient] = {}
+mongo_pool_listener = MongoPoolListener()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The process-wide HTTP pool used for Azure OpenAI"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            http2=LLM_HTTP2,
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+        )
+    return _http_client
+
+
+def get_llm_client() -> AsyncAzureOpenAI:
+    """The process-wide Azure OpenAI client, on the shared HTTP pool"""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = AsyncAzureOpenAI(
+            api_key=os.getenv("api_key"),
+            azure_endpoint=os.getenv("endpoint"),
+            api_version=os.getenv("api_version"),
+            http_client=get_http_client(),
+            max_retries=LLM_SDK_MAX_RETRIES
+        )
+    return _llm_client
+
+
+def get_motor_client(mongodb_uri: str) -> AsyncIOMotorClient:
+    """One motor client (and so one connection pool) per URI per process"""
+    client = _motor_clients.get(mongodb_uri)
+    if client is None:
+        client = AsyncIOMotorClient(
+            mongodb_uri,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            event_listeners=[mongo_pool_listener]
+        )
+        _motor_clients[mongodb_uri] = client
+    return client
+
+
+def http_pool_stats() -> Dict:
+    stats = {
+        "http2": LLM_HTTP2,
+        "max_connections": LLM_MAX_CONNECTIONS,
+        "max_keepalive": LLM_MAX_KEEPALIVE
+    }
+    if _http_client is None:
+        return stats
+    # httpx does not expose pool state; read it from the httpcore pool when present
+    pool = getattr(getattr(_http_client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is not None:
+        stats["connections"] = len(connections)
+        stats["idle"] = sum(1 for connection in connections if connection.is_idle())
+        stats["in_use"] = stats["connections"] - stats["idle"]
+        stats["utilization"] = stats["in_use"] / LLM_MAX_CONNECTIONS if LLM_MAX_CONNECTIONS else 0
+    return stats
+
+
+def pool_stats() -> Dict:
+    return {
+        "llm_http": http_pool_stats(),
+        "mongo": mongo_pool_listener.stats()
+    }
+
+
+async def close_clients():
+    global _http_client, _llm_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        _llm_client = None
+    for client in _motor_clients.values():
+        client.close()
+    _motor_clients.clear()
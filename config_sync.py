@@ -0,0 +1,139 @@
+import asyncio
+import os
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure, PyMongoError
+
+CONFIG_VERSIONS = "config_versions"
+BOT_CONFIG_VERSION_ID = "bot_configs"
+WATCHED_COLLECTIONS = ["bot_configs", "bot_configs_analyser", CONFIG_VERSIONS]
+
+
+async def bump_config_version(db) -> int:
+    """
+    Record that a bot or analyser configuration changed.
+
+    Every write to bot_configs / bot_configs_analyser must call this so
+    workers in polling mode notice the change.
+    """
+    doc = await db[CONFIG_VERSIONS].find_one_and_update(
+        {"_id": BOT_CONFIG_VERSION_ID},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc["version"]
+
+
+async def get_config_version(db) -> int:
+    doc = await db[CONFIG_VERSIONS].find_one({"_id": BOT_CONFIG_VERSION_ID})
+    return doc["version"] if doc else 0
+
+
+class BotConfigSync:
+    """
+    Keeps the bot registries of every worker in line with the database.
+
+    Watches bot_configs and bot_configs_analyser through a MongoDB change
+    stream and reloads only the changed bot. Change streams need a replica
+    set; against a standalone mongod it falls back to polling the shared
+    config version and running an incremental reload when it moves.
+
+    mode: "auto" (change stream, else polling), "changestream", "poll" or "off".
+    """
+
+    def __init__(self, bot_factory, mode: str = "auto", poll_interval: float = 5.0):
+        self.bot_factory = bot_factory
+        self.db = bot_factory.db
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.version = 0
+        self.active_mode: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, bot_factory) -> "BotConfigSync":
+        return cls(
+            bot_factory,
+            mode=os.getenv("BOT_CONFIG_SYNC", "auto"),
+            poll_interval=float(os.getenv("BOT_CONFIG_POLL_INTERVAL", "5"))
+        )
+
+    async def start(self):
+        self.version = await get_config_version(self.db)
+        if self.mode != "off":
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def reload_all(self):
+        """Incremental reload of both registries (unchanged bots are kept)"""
+        await self.bot_factory.initialize_bots()
+        await self.bot_factory.initialize_bots_analyser()
+
+    async def _run(self):
+        if self.mode in ("auto", "changestream"):
+            while True:
+                try:
+                    await self._watch()
+                except OperationFailure as e:
+                    if self.mode == "auto":
+                        print(f"Bot config change stream unavailable, polling instead: {e}")
+                        break
+                    print(f"Bot config change stream failed: {e}")
+                except PyMongoError as e:
+                    print(f"Bot config change stream failed: {e}")
+                # Changes may have been missed while the stream was down
+                await asyncio.sleep(self.poll_interval)
+                await self._safe_reload_all()
+        await self._poll()
+
+    async def _watch(self):
+        pipeline = [{"$match": {"ns.coll": {"$in": WATCHED_COLLECTIONS}}}]
+        async with self.db.watch(pipeline, full_document="updateLookup") as stream:
+            self.active_mode = "changestream"
+            async for change in stream:
+                await self._apply(change)
+
+    async def _apply(self, change):
+        collection = change["ns"]["coll"]
+        document = change.get("fullDocument")
+        try:
+            if collection == CONFIG_VERSIONS:
+                if document:
+                    self.version = document.get("version", self.version)
+            elif document and "bot_id" in document:
+                if collection == "bot_configs":
+                    await self.bot_factory.reload_bot(document["bot_id"])
+                else:
+                    await self.bot_factory.reload_bot_analyser(document["bot_id"])
+            elif collection == "bot_configs":
+                # Deletes only carry the _id; rebuild the map (unchanged bots are kept)
+                await self.bot_factory.initialize_bots()
+            else:
+                await self.bot_factory.initialize_bots_analyser()
+        except Exception as e:
+            print(f"Error applying bot config change: {e}")
+
+    async def _safe_reload_all(self):
+        try:
+            await self.reload_all()
+        except Exception as e:
+            print(f"Error reloading bots: {e}")
+
+    async def _poll(self):
+        self.active_mode = "poll"
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                version = await get_config_version(self.db)
+            except PyMongoError as e:
+                print(f"Error reading bot config version: {e}")
+                continue
+            if version != self.version:
+                await self._safe_reload_all()
+                self.version = version
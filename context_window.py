@@ -0,0 +1,197 @@
+import asyncio
+import math
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv(".env")
+
+try:
+    import tiktoken
+except ImportError:  # token counts fall back to a characters/4 estimate
+    tiktoken = None
+
+# Tokens the chat format adds around every message
+MESSAGE_OVERHEAD = 4
+
+SUMMARY_PROMPT = (
+    "Summarise the earlier part of this role-play conversation for the assistant that continues it. "
+    "Keep names, facts the user gave, questions already asked and answered, corrections made and the "
+    "current stage of the conversation. Plain text, at most 200 words."
+)
+
+
+class TokenCounter:
+    """
+    Counts tokens with tiktoken when it is installed, else estimates len/4.
+
+    Counts are cached by text: history messages are counted once, not on
+    every turn they are sent again.
+    """
+
+    def __init__(self, encoding_name: str = "o200k_base", cache_size: int = 10000):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                print(f"tiktoken encoding {encoding_name} unavailable, estimating tokens: {e}")
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[str, int]" = OrderedDict()
+
+    def count(self, text: str) -> int:
+        tokens = self.cache.get(text)
+        if tokens is not None:
+            self.cache.move_to_end(text)
+            return tokens
+        if self.encoding is not None:
+            tokens = len(self.encoding.encode(text, disallowed_special=()))
+        else:
+            tokens = math.ceil(len(text) / 4)
+        self.cache[text] = tokens
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return tokens
+
+    def count_message(self, message: Dict[str, str]) -> int:
+        return self.count(message["content"]) + MESSAGE_OVERHEAD
+
+
+token_counter = TokenCounter(os.getenv("CONTEXT_ENCODING", "o200k_base"))
+
+
+class ContextWindow:
+    """
+    Fits a conversation into a prompt token budget.
+
+    The system messages (prompt and rolling summary) are always kept; the
+    rest is filled with the most recent messages that fit, but never fewer
+    than min_recent. budget = 0 (the default) sends everything; set it to
+    the deployment's context size minus the reply's max_tokens, ideally
+    with CONTEXT_SUMMARY=1 so left-out turns are summarised, not lost.
+    """
+
+    def __init__(self, budget: int = 0, min_recent: int = 4, counter: TokenCounter = token_counter):
+        self.budget = budget
+        self.min_recent = min_recent
+        self.counter = counter
+        self.counters = {"prompts": 0, "trimmed_prompts": 0, "dropped_messages": 0}
+
+    @classmethod
+    def from_env(cls) -> "ContextWindow":
+        return cls(
+            budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "0")),
+            min_recent=int(os.getenv("CONTEXT_MIN_RECENT", "4"))
+        )
+
+    def split(self, system: List[Dict[str, str]], messages: List[Dict[str, str]]) -> int:
+        """How many leading messages do not fit next to the system messages"""
+        if self.budget <= 0:
+            return 0
+        remaining = self.budget - sum(self.counter.count_message(m) for m in system)
+        kept = 0
+        for message in reversed(messages):
+            tokens = self.counter.count_message(message)
+            if kept >= self.min_recent and tokens > remaining:
+                break
+            remaining -= tokens
+            kept += 1
+        return len(messages) - kept
+
+    def fit(self, system: List[Dict[str, str]], messages: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], int]:
+        """The prompt to send and the number of messages left out of it"""
+        dropped = self.split(system, messages)
+        self.counters["prompts"] += 1
+        if dropped:
+            self.counters["trimmed_prompts"] += 1
+            self.counters["dropped_messages"] += dropped
+        return system + messages[dropped:], dropped
+
+    def stats(self) -> Dict:
+        return {**self.counters, "budget": self.budget, "min_recent": self.min_recent}
+
+
+def summary_message(summary: str) -> Dict[str, str]:
+    return {"role": "system", "content": f"Summary of the conversation so far:\n{summary}"}
+
+
+class ConversationSummarizer:
+    """
+    Rolling summary of the turns that no longer fit the context window.
+
+    After a reply, if at least min_messages turns have fallen out of the
+    window, they are folded into the session's summary in the background
+    (one run per session at a time) and stored with summary_upto, the number
+    of history messages it covers. Later turns send the summary instead of
+    those messages, so each part of a session is summarised once.
+    """
+
+    def __init__(self, session_store, enabled: bool = False, min_messages: int = 6):
+        self.session_store = session_store
+        self.enabled = enabled
+        self.min_messages = min_messages
+        self.running: Dict[str, asyncio.Task] = {}
+        self.counters = {"summaries": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls, session_store) -> "ConversationSummarizer":
+        return cls(
+            session_store,
+            enabled=os.getenv("CONTEXT_SUMMARY", "0") == "1",
+            min_messages=int(os.getenv("CONTEXT_SUMMARY_MIN_MESSAGES", "6"))
+        )
+
+    def maybe_summarize(self, session, bot):
+        """
+        Schedule a summary update when enough of the session fell out of the window.
+
+        session is a ChatSession or a SessionView; for a view only its
+        messages are looked at, and the ones to summarise are read back.
+        """
+        if not self.enabled or session.session_id in self.running:
+            return
+        offset = getattr(session, "history_offset", 0)
+        history = bot.history_messages(session.conversation_history, session.session_id, offset)
+        start = max(0, session.summary_upto - offset)
+        system = bot.system_messages(session.summary if session.summary_upto else None)
+        upto = offset + start + bot.context_window.split(system, history[start:])
+        if upto - session.summary_upto < self.min_messages:
+            return
+        task = asyncio.create_task(self._summarize(session, bot, upto))
+        self.running[session.session_id] = task
+        task.add_done_callback(lambda _: self.running.pop(session.session_id, None))
+
+    async def _summarize(self, session, bot, upto: int):
+        # Imported here: admission counts tokens with this module's counter
+        from admission import admission, BACKGROUND
+        try:
+            messages = await self.session_store.get_messages(
+                session.session_id, session.summary_upto, upto - session.summary_upto
+            )
+            transcript = "\n".join(f"{m['role']}: {m['content']}" for m in map(bot.format_message, messages))
+            if session.summary_upto and session.summary:
+                transcript = f"Earlier summary:\n{session.summary}\n\nLater turns:\n{transcript}"
+            response, permit = await admission.create(
+                bot.llm_client,
+                bot.llm_model,
+                [
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": transcript}
+                ],
+                max_tokens=400,
+                priority=BACKGROUND,
+                temperature=0.2
+            )
+            permit.release()
+            summary = response.choices[0].message.content
+            if summary:
+                await self.session_store.set_summary(session.session_id, summary.strip(), upto)
+                self.counters["summaries"] += 1
+        except Exception as e:
+            print(f"Error summarising session {session.session_id}: {e}")
+            self.counters["errors"] += 1
+
+    def stats(self) -> Dict:
+        return {**self.counters, "enabled": self.enabled, "running": len(self.running)}
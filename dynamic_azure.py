@@ -6,7 +6,8 @@ from fastapi import FastAPI, HTTPException, Depends, Query
 import importlib
 import inspect
 from fastapi import FastAPI, HTTPException, Depends, Form, UploadFile, File
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
+from starlette.background import BackgroundTask
 from pydantic import BaseModel,Field
 from typing import Dict, List, Optional
 from datetime import datetime
@@ -25,16 +26,35 @@ import time
 import base64
 from mongo import MongoDB
 from factory_azure import DynamicBotFactory
+from bots_azure import AnalysisError
+from session_cache import SessionCache
+from config_sync import BotConfigSync
+from session_analysis import SessionAnalysisService
+from context_window import ConversationSummarizer
+from prompt_cache import prompt_cache_stats
+from admission import admission
+from paraphrase_cache import paraphrase_cache
+from analysis_jobs import AnalysisJobQueue
+from paraphrase_jobs import ParaphraseJobRunner
+from clients import get_motor_client, get_llm_client, close_clients, pool_stats
 from models import (
     Message, ChatSession, ChatResponse, ChatReport, BotConfig, BotConfigAnalyser,
-    QuestionScenarioDoc, ParaphrasedQuestionCache, QuestionSession)
-from speech import router as speech_router
+    QuestionScenarioDoc, ParaphrasedQuestionCache, QuestionSession, AnalysisBatchRequest,
+    ParaphrasingRequest)
+from speech import router as speech_router, generate_audio_for_chat, SentenceTTSPipeline
+from stream_tags import ChatTagParser, clean_text_for_speech
 # from question_bot import QuestionBot
 load_dotenv('.env')
 # MongoDB configuration
 MONGO_URL = os.getenv("MONGO_URL")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 print(MONGO_URL,DATABASE_NAME)
+# Messages read per chat turn; the context window picks from these (0 = whole history).
+# Without a token budget the whole history is sent, so by default the whole history is read too
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+SESSION_VIEW_MESSAGES = int(os.getenv("SESSION_VIEW_MESSAGES", "40" if CONTEXT_TOKEN_BUDGET > 0 else "0"))
+# Most session_ids accepted by one /gt/api/sessionAnalyser/batch call
+ANALYSIS_BATCH_LIMIT = int(os.getenv("ANALYSIS_BATCH_LIMIT", "500"))
 
 
 
@@ -53,28 +73,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-db = MongoDB(MONGO_URL,DATABASE_NAME)
+db = MongoDB(MONGO_URL,DATABASE_NAME,client=get_motor_client(MONGO_URL))
+session_cache = SessionCache.from_env(db)
+context_summarizer = ConversationSummarizer.from_env(session_cache)
 app.include_router(speech_router)
 @app.get("/gt/api/check")
 async def say_hi():
     return {"message": "hi"}	
-# Create bot factory
+# Create bot factory (chat and analyser bots share its Mongo and LLM clients)
 bot_factory = DynamicBotFactory(
     mongodb_uri=os.getenv("MONGO_URL"), 
-    database_name=os.getenv("DATABASE_NAME")
-)
-bot_factory_analyser = DynamicBotFactory(
-    mongodb_uri=os.getenv("MONGO_URL"), 
-    database_name=os.getenv("DATABASE_NAME")
+    database_name=os.getenv("DATABASE_NAME"),
+    client=get_motor_client(MONGO_URL),
+    llm_client=get_llm_client()
 )
+# Applies bot config changes made by any worker to this worker's factories
+config_sync = BotConfigSync.from_env(bot_factory)
+session_analysis = SessionAnalysisService(db, bot_factory, session_cache)
+analysis_jobs = AnalysisJobQueue.from_env(db, session_analysis)
+paraphrase_jobs = ParaphraseJobRunner.from_env(db, bot_factory, get_llm_client())
 
 @app.on_event("startup")
 async def startup_event():
     """
     Initialize bots when application starts
     """
+    await db.create_indexes()
     await bot_factory.initialize_bots()
-    await bot_factory_analyser.initialize_bots_analyser()
+    await bot_factory.initialize_bots_analyser()
+    session_cache.start()
+    await config_sync.start()
+    analysis_jobs.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Write any buffered chat messages before the worker exits
+    """
+    await analysis_jobs.stop()
+    await paraphrase_jobs.stop()
+    await config_sync.stop()
+    await session_cache.stop()
+    await close_clients()
 # Dependency to get database
 async def get_db():
     return db
@@ -83,6 +123,7 @@ def replace_name(original_text, your_name,replace):
         return original_text.replace(replace, your_name)
     return original_text
 
+
 from fastapi.responses import StreamingResponse
 from fastapi import Query
 
@@ -91,13 +132,28 @@ async def chat_stream(
     id: str = Query(...),
     name: Optional[str] = Query(None),
     voice_id: Optional[str] = Query(default="ar-SA-HamedNeural"),
+    tts_mode: str = Query(default="full"),
+    protocol: str = Query(default="full"),
     db: MongoDB = Depends(get_db)
 ):
     """
     Stream the response for a chat message.
+
+    tts_mode="full" attaches one audio clip for the whole reply to the final
+    event. tts_mode="pipelined" synthesizes each sentence as soon as it has
+    streamed and sends it as its own {"type": "audio"} event.
+
+    protocol="full" re-sends the whole parsed reply on every event.
+    protocol="delta" sends only the new text per {"type": "delta"} event and
+    one {"type": "summary"} event with the complete reply at the end.
     """
-    # Get session
-    session = await db.get_session(id)
+    if tts_mode not in ("full", "pipelined"):
+        raise HTTPException(status_code=400, detail="tts_mode must be 'full' or 'pipelined'")
+    if protocol not in ("full", "delta"):
+        raise HTTPException(status_code=400, detail="protocol must be 'full' or 'delta'")
+
+    # Get session: metadata and the last messages only; the prompt never needs more
+    session = await session_cache.get_session_view(id, SESSION_VIEW_MESSAGES or None)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
@@ -112,85 +168,179 @@ async def chat_stream(
     message = previous_message.content
     
     # Process the message and get the response stream
+    response = None
     try:
         response = await bot.process_message(
             message,
             session.conversation_history,
-            name
+            name,
+            summary=session.summary,
+            summary_upto=session.summary_upto,
+            session_id=session.session_id,
+            history_offset=session.history_offset
         )
         
-        async def stream_chat():
-            import base64
-            import re
+        def full_response_data(updated_message, chunk_data, audio_data):
+            # Parse for correct formatting tags
+            result = re.split(r"\[CORRECT\]", updated_message)
+            correct_answer = ''
+            if len(result) >= 3:
+                correct_answer = result[1]
+                answer = result[0]
+            else:
+                answer = re.sub(r"\[CORRECT\]", "", updated_message)
+            
+            # Check if this is the end of the conversation
+            is_finished = "[FINISH]" in updated_message
+            if is_finished:
+                answer = updated_message.replace("[FINISH]", " ")
+                complete = True
+            else:
+                complete = False
+            
+            # Check if correction is needed
+            correct = "[CORRECT]" not in updated_message
             
+            response_data = {
+                "response": answer,
+                "emotion": "neutral",
+                "complete": complete,
+                "correct": correct,
+                "correct_answer": correct_answer,
+                "finish": "stop" if chunk_data["finish"] == "stop" else None
+            }
+            
+            # Add audio data if available and streaming is finished
+            if chunk_data["finish"] == "stop" and audio_data and len(audio_data) > 0:
+                response_data["audio"] = base64.b64encode(audio_data).decode('utf-8')
+                response_data["audio_format"] = "wav"
+            return response_data
+
+        def audio_event(segment):
+            event = {
+                "type": "audio",
+                "segment": segment["segment"],
+                "text": segment["text"],
+                "audio": base64.b64encode(segment["audio"]).decode('utf-8'),
+                "audio_format": "wav"
+            }
+            if segment["error"]:
+                # Sent anyway, so the client knows this sentence has no audio
+                event["error"] = segment["error"]
+            return event
+
+        async def stream_chat():
             full_text = ""
             audio_data = None
+            usage = None
+            parser = ChatTagParser()
+            pipeline = SentenceTTSPipeline(voice_id) if tts_mode == "pipelined" else None
             
-            async for chunk_data in response:
-                updated_message = chunk_data["chunk"]
-                full_text = updated_message
-                
-                # Check if complete
-                if chunk_data["finish"] == "stop" and chunk_data["usage"] is not None:
-                    # Add bot message to conversation history
-                    bot_message = Message(
-                        role=bot.bot_role,
-                        content=updated_message,
-                        timestamp=datetime.now()
-                    )
-                    session.conversation_history.append(bot_message)
-                    await db.update_session(session)
+            try:
+                async for chunk_data in response:
+                    updated_message = chunk_data["chunk"]
+                    full_text = updated_message
+                    answer_delta, correction_delta = parser.feed(chunk_data.get("delta", ""))
+
+                    if pipeline:
+                        pipeline.feed(answer_delta.replace("*", "").replace("#", ""))
                     
-                    # Generate TTS for complete response
+                    # Check if complete
+                    if chunk_data["finish"] == "stop" and chunk_data["usage"] is not None:
+                        usage = chunk_data["usage"]
+                        # Add bot message to conversation history
+                        bot_message = Message(
+                            role=bot.bot_role,
+                            content=updated_message,
+                            timestamp=datetime.now()
+                        )
+                        await session_cache.append_messages(session.session_id, [bot_message])
+                        session.conversation_history.append(bot_message)
+                        session.message_count += 1
+                        context_summarizer.maybe_summarize(session, bot)
+                        
+                        # Generate TTS for complete response (pipelined mode already has it queued)
+                        if not pipeline:
+                            try:
+                                clean_text = clean_text_for_speech(full_text).strip()
+                                audio_data = await generate_audio_for_chat(clean_text, voice_id)
+                            except Exception as e:
+                                print(f"TTS generation failed: {e}")
+                                audio_data = None
+
+                    if protocol == "delta":
+                        if answer_delta or correction_delta:
+                            delta_data = {
+                                "type": "delta",
+                                "response": answer_delta,
+                                "correct_answer": correction_delta
+                            }
+                            yield f"data: {json.dumps(delta_data)}\n\n"
+                    else:
+                        yield f"data: {json.dumps(full_response_data(updated_message, chunk_data, audio_data))}\n\n"
+
+                    # Send sentence audio as soon as it is ready, in order
+                    if pipeline:
+                        for segment in pipeline.ready_segments():
+                            yield f"data: {json.dumps(audio_event(segment))}\n\n"
+
+                # A partial tag left at the very end is plain text
+                answer_delta, correction_delta = parser.flush()
+                if pipeline:
+                    pipeline.feed(answer_delta.replace("*", "").replace("#", ""))
+
+                if protocol == "delta":
+                    if answer_delta or correction_delta:
+                        # So the deltas still add up to the summary
+                        delta_data = {
+                            "type": "delta",
+                            "response": answer_delta,
+                            "correct_answer": correction_delta
+                        }
+                        yield f"data: {json.dumps(delta_data)}\n\n"
+                    summary_data = {
+                        "type": "summary",
+                        "response": parser.answer,
+                        "emotion": "neutral",
+                        "complete": parser.finished,
+                        "correct": not parser.has_correction,
+                        "correct_answer": parser.correct_answer,
+                        "finish": "stop",
+                        "usage": usage
+                    }
+                    if audio_data:
+                        summary_data["audio"] = base64.b64encode(audio_data).decode('utf-8')
+                        summary_data["audio_format"] = "wav"
+                    yield f"data: {json.dumps(summary_data)}\n\n"
+
+                if parser.finished and usage is not None:
+                    # Conversation is over: have the report ready before anyone asks for it
                     try:
-                        from speech import generate_audio_for_chat
-                        clean_text = re.sub(r'\[CORRECT\].*?\[CORRECT\]', '', full_text, flags=re.DOTALL)
-                        clean_text = clean_text.replace("[FINISH]", "").replace("*", "").replace("#", "").strip()
-                        audio_data = await generate_audio_for_chat(clean_text, voice_id)
+                        await analysis_jobs.enqueue(session.session_id, source="finish")
                     except Exception as e:
-                        print(f"TTS generation failed: {e}")
-                        audio_data = None
-                
-                # Parse for correct formatting tags
-                result = re.split(r"\[CORRECT\]", updated_message)
-                correct_answer = ''
-                if len(result) >= 3:
-                    correct_answer = result[1]
-                    answer = result[0]
-                else:
-                    answer = re.sub(r"\[CORRECT\]", "", updated_message)
-                
-                # Check if this is the end of the conversation
-                is_finished = "[FINISH]" in updated_message
-                if is_finished:
-                    answer = updated_message.replace("[FINISH]", " ")
-                    complete = True
-                else:
-                    complete = False
-                
-                # Check if correction is needed
-                correct = "[CORRECT]" not in updated_message
-                
-                response_data = {
-                    "response": answer,
-                    "emotion": "neutral",
-                    "complete": complete,
-                    "correct": correct,
-                    "correct_answer": correct_answer,
-                    "finish": "stop" if chunk_data["finish"] == "stop" else None
-                }
-                
-                # Add audio data if available and streaming is finished
-                if chunk_data["finish"] == "stop" and audio_data and len(audio_data) > 0:
-                    response_data["audio"] = base64.b64encode(audio_data).decode('utf-8')
-                    response_data["audio_format"] = "wav"
-                
-                yield f"data: {json.dumps(response_data)}\n\n"
+                        print(f"Error queueing session analysis: {e}")
+
+                if pipeline:
+                    async for segment in pipeline.finish():
+                        yield f"data: {json.dumps(audio_event(segment))}\n\n"
+            finally:
+                # Client disconnected mid-stream: drop queued synthesis
+                if pipeline:
+                    pipeline.cancel()
+                await response.aclose()
                 
-        return StreamingResponse(stream_chat(), media_type="text/event-stream")
+        # Also closed after the response, in case stream_chat never started (its finally would not run)
+        return StreamingResponse(stream_chat(), media_type="text/event-stream",
+                                 background=BackgroundTask(response.aclose))
         
+    except HTTPException:
+        # e.g. 503 + Retry-After from LLM admission control
+        raise
     except Exception as e:
         print(f"Error in chat stream: {e}")
+        if response is not None:
+            # Frees the LLM admission slot
+            await response.aclose()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/gt/api/chat")
@@ -216,13 +366,14 @@ async def chat(
             scenario_name=scenario_name,
             conversation_history=[]
         )
-        await db.create_session(session)
         id = session.session_id
+        is_new_session = True
     else:
-        # Get existing session
-        session = await db.get_session(id)
+        # Existing session: only its metadata is needed to append the message
+        session = await session_cache.get_session_view(id, last_n=0)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
+        is_new_session = False
     
     # Get bot
     bot = await bot_factory.get_bot(session.scenario_name)
@@ -234,14 +385,13 @@ async def chat(
         timestamp=datetime.now()
     )
     
-    # Initialize conversation_history if it doesn't exist
-    if not hasattr(session, "conversation_history") or session.conversation_history is None:
-        session.conversation_history = []
-    
-    session.conversation_history.append(user_message)
-    
-    # Update session in database
-    await db.update_session(session)
+    # New sessions are inserted with their first message; existing ones only get the message appended
+    if is_new_session:
+        session.conversation_history.append(user_message)
+        await session_cache.create_session(session)
+    else:
+        # Written through: /gt/api/chat/stream reads it next, possibly on another worker
+        await session_cache.append_messages(id, [user_message], write_through=True)
     
     # Return acknowledgment with session id
     return {
@@ -271,9 +421,9 @@ async def chat_legacy(message: str = Form(...),
             scenario_name=scenario_name,
             conversation_history=[]
         )
-        await db.create_session(session)
+        await session_cache.create_session(session)
     else:
-        session= await db.get_session(session_id)
+        session= await session_cache.get_session(session_id)
         if not session:
             raise HTTPException(status_code=400,detail="Session not found")
     
@@ -282,12 +432,15 @@ async def chat_legacy(message: str = Form(...),
     session.conversation_history.append(new_message)
     
     response = await bot.get_farmer_response(
-        message, session.scenario_name, session.conversation_history
+        message, session.scenario_name, session.conversation_history,
+        summary=session.summary, summary_upto=session.summary_upto,
+        session_id=session.session_id
     )
 
-    bot_message = Message(role=f"{bot.bot_role}", content=response)
+    bot_message = Message(role=bot.bot_role, content=response, timestamp=datetime.now())
     session.conversation_history.append(bot_message)
-    await db.update_session(session)
+    await session_cache.append_messages(session.session_id, [new_message, bot_message])
+    context_summarizer.maybe_summarize(session, bot)
 
     return ChatResponse(
         session_id=session.session_id,
@@ -310,13 +463,14 @@ async def update_bot(bot_id: str, update_data: Dict):
     return {"message": "Bot configuration updated successfully"}
 
 @app.get("/gt/api/available_bots")
-async def get_available_bots():
+async def get_available_bots(response: Response):
     """
     Get list of available active bots
     
-    :return: List of active bot IDs
+    :return: List of active bot IDs; the X-Config-Version header holds the
+        bot config version this worker has applied
     """
-    print(list(bot_factory.bots.keys()),bot_factory.bots)
+    response.headers["X-Config-Version"] = str(config_sync.version)
     return list(bot_factory.bots.keys())
 
 @app.post("/gt/api/createBot")
@@ -328,7 +482,8 @@ async def createBot(
     system_prompt: str=Form(default=None),
     is_active: bool = Form(default=True),
     bot_class: Optional[str] = Form(default=None),
-    llm_model: str=Form(default='gpt-4o')):
+    llm_model: str=Form(default='gpt-4o'),
+    opening_lines: Optional[str] = Form(default=None)):
  
                   
     bot_ = BotConfig(bot_id=str(uuid.uuid4()),
@@ -339,11 +494,11 @@ async def createBot(
                     system_prompt=system_prompt,
                     is_active=is_active,
                     bot_class=bot_class,
-                  
+                    opening_lines=json.loads(opening_lines) if opening_lines else [],
                     llm_model=llm_model)
     await db.create_bot(bot_)
     # await bot_factory.create_bot(bot_)
-    await bot_factory.initialize_bots()
+    await bot_factory.reload_bot(bot_.bot_id)
     return bot_
     
 @app.post("/gt/api/createBotAnalyser")
@@ -365,43 +520,43 @@ async def createBotAnalyser(
                     llm_model=llm_model)
     await db.create_bot_analyser(bot_)
     # await bot_factory.create_bot(bot_)
-    await bot_factory_analyser.initialize_bots_analyser()
+    await bot_factory.reload_bot_analyser(bot_.bot_id)
     return bot_
     
     
+@app.post("/gt/api/sessionAnalyser/batch")
+async def queue_session_analyses(request: AnalysisBatchRequest):
+    """Queue analyses for many sessions; poll /gt/api/sessionAnalyser/jobs/{job_id}"""
+    if not request.session_ids:
+        raise HTTPException(status_code=400, detail="session_ids must not be empty")
+    if len(request.session_ids) > ANALYSIS_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {ANALYSIS_BATCH_LIMIT} session_ids per batch")
+    jobs = await analysis_jobs.enqueue_many(request.session_ids)
+    return {"jobs": jobs}
+
+@app.get("/gt/api/sessionAnalyser/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    job = await analysis_jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.get("/gt/api/sessionAnalyser/{session_id}")    
-async def get_session_analysis(
-    session_id: str,
-    db: MongoDB = Depends(get_db)
-):
-    session2 = await db.get_session_raw(session_id)
-    analysis= await db.get_session_analysis(session_id)
-    if not session2:
+async def get_session_analysis(session_id: str):
+    # Cached per conversation state; concurrent requests share one analysis
+    try:
+        report = await session_analysis.get_analysis(session_id)
+    except AnalysisError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    if report is None:
         raise HTTPException(status_code=404, detail="Session not found")
-    if not analysis:
-    # Access the conversation_history
-        conversation_history = session2['conversation_history']
-
-
-        conversation = {"conversation_history":conversation_history}
-        analyzer= await bot_factory_analyser.get_bot_analyser(session2['scenario_name'])
-        print(analyzer)
-        results = await analyzer.analyze_conversation(conversation)
-        results['session_id']=session2['session_id']
-        results['conversation_id']=str(uuid.uuid4())
-        results['timestamp']=datetime.now()
-        category_scores=results['category_scores']
-        # results['overall_score']=category_scores['language_and_communication']+category_scores['product_knowledge']+category_scores['empathy_and_trust']+category_scores['process_clarity']+category_scores['product_suitability']
-        report = ChatReport(**results)
-        model= await db.create_conversation_analysis(report)
-        return report
-    return analysis
+    return report
 
     
 @app.get("/gt/api/refreshBots")
 async def refresh_bots():
     await bot_factory.initialize_bots()
-    await bot_factory_analyser.initialize_bots_analyser()
+    await bot_factory.initialize_bots_analyser()
 
 
 # ===== BOT MANAGEMENT (Minimal) =====
@@ -430,3 +585,100 @@ async def refresh_question_bots():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error refreshing bots: {str(e)}")
 
+
+# ===== PARAPHRASES =====
+
+@app.post("/gt/api/paraphrases/jobs")
+async def start_paraphrase_job(request: ParaphrasingRequest):
+    """Pre-generate paraphrases for a scenario in the background; poll /gt/api/paraphrases/jobs/{job_id}"""
+    return await paraphrase_jobs.start(request)
+
+@app.get("/gt/api/paraphrases/jobs/{job_id}")
+async def get_paraphrase_job(job_id: str):
+    job = await paraphrase_jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/gt/api/paraphrases/jobs/{job_id}/resume")
+async def resume_paraphrase_job(job_id: str):
+    """Continue an interrupted job, or retry the questions that failed"""
+    return await paraphrase_jobs.resume(job_id)
+
+
+# ===== ANALYTICS =====
+
+@app.get("/gt/api/analytics/question-sessions/{scenario_name}")
+async def get_question_session_analytics(
+    scenario_name: str,
+    days: int = Query(default=7, ge=1, le=366),
+    exact: bool = Query(default=False),
+    db: MongoDB = Depends(get_db)
+):
+    """Question session counts, completion rate and average score, per day and in total"""
+    return await db.get_session_analytics(scenario_name, days, exact)
+
+
+# ===== ADMIN / STATS =====
+
+@app.get("/gt/api/admin/session-cache")
+async def get_session_cache_stats():
+    """Hit/miss and write-behind counters of the in-process session cache"""
+    return session_cache.stats()
+
+@app.get("/gt/api/admin/session-analysis")
+async def get_session_analysis_stats():
+    """Cached, recomputed and deduplicated session analyses"""
+    return session_analysis.stats()
+
+@app.get("/gt/api/admin/analysis-jobs")
+async def get_analysis_job_stats():
+    """Background analysis workers and job counts per status"""
+    return await analysis_jobs.stats()
+
+@app.get("/gt/api/admin/context-window")
+async def get_context_window_stats():
+    """Per bot: prompts sent, prompts trimmed to the token budget and messages left out"""
+    return {name: bot.context_window.stats() for name, bot in bot_factory.bots.items()}
+
+@app.get("/gt/api/admin/context-summaries")
+async def get_context_summary_stats():
+    """Rolling conversation summaries written and in progress"""
+    return context_summarizer.stats()
+
+@app.get("/gt/api/admin/prompt-cache")
+async def get_prompt_cache_stats():
+    """Azure OpenAI prompt cache hits and cached prompt tokens per bot"""
+    return prompt_cache_stats.stats()
+
+@app.get("/gt/api/admin/llm-admission")
+async def get_llm_admission_stats():
+    """Per-deployment admission: in flight, waiting by priority, rejections and 429 retries"""
+    return admission.stats()
+
+@app.post("/gt/api/admin/rollups/rebuild")
+async def rebuild_rollups(db: MongoDB = Depends(get_db)):
+    """Recompute the question session daily rollups from the sessions"""
+    return {"rollup_documents": await db.rebuild_session_rollups()}
+
+@app.post("/gt/api/admin/analyses/deduplicate")
+async def deduplicate_analyses(db: MongoDB = Depends(get_db)):
+    """One-off: drop all but the newest report per session so the unique index can be built"""
+    removed = await db.remove_duplicate_analyses()
+    results = await db.create_indexes()
+    return {"removed": removed, "analysis_indexes": results.get("analysis", {})}
+
+@app.get("/gt/api/admin/paraphrase-cache")
+async def get_paraphrase_cache_stats():
+    """Hit/miss counters of the process-local paraphrase cache"""
+    return paraphrase_cache.stats()
+
+@app.get("/gt/api/admin/indexes")
+async def get_index_report(db: MongoDB = Depends(get_db)):
+    """Declared indexes that are missing, plus undeclared and unused ones"""
+    return await db.index_report()
+
+@app.get("/gt/api/admin/pools")
+async def get_pool_stats():
+    """Connection usage of the shared Azure OpenAI HTTP pool and MongoDB pool"""
+    return pool_stats()
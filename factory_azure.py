@@ -4,6 +4,7 @@ from typing import Dict, List, Optional, Type
 from pydantic import BaseModel, Field
 from motor.motor_asyncio import AsyncIOMotorClient
 from fastapi import FastAPI, HTTPException, Depends
+import asyncio
 import importlib
 import inspect
 from fastapi import FastAPI, HTTPException, Depends, Form, UploadFile, File
@@ -27,28 +28,36 @@ from models import (
     Message, ChatSession, ChatResponse, ChatReport, BotConfig, BotConfigAnalyser,
     QuestionScenarioDoc, ParaphrasedQuestionCache, QuestionSession)
 from bots_azure import BaseLLMBot, BaseAnalyserBot
+from config_sync import bump_config_version
+from clients import get_motor_client, get_llm_client
 
 class DynamicBotFactory:
     """
     Factory for creating dynamic bot instances based on database configurations
     """
-    def __init__(self, mongodb_uri: str, database_name: str):
+    def __init__(self, mongodb_uri: str, database_name: str,
+                 client: Optional[AsyncIOMotorClient] = None,
+                 llm_client: Optional[AsyncAzureOpenAI] = None):
         """
         Initialize bot factory with MongoDB connection
         
         :param mongodb_uri: MongoDB connection string
         :param database_name: Name of the database
+        :param client: Motor client to use; defaults to the shared one from clients.py
+        :param llm_client: Azure OpenAI client to use; defaults to the shared one from clients.py
         """
-        self.client = AsyncIOMotorClient(mongodb_uri)
+        self.client = client or get_motor_client(mongodb_uri)
         self.db = self.client[database_name]
+        # Chat bots and analyser bots live in separate registries, keyed by bot_description
         self.bots: Dict[str, BaseLLMBot] = {}
+        self.analysers: Dict[str, BaseAnalyserBot] = {}
+        # Full and single-bot reloads of a registry run one at a time; otherwise a full
+        # reload that read its configs before a single reload finished would swap in the older bot
+        self.bots_lock = asyncio.Lock()
+        self.analysers_lock = asyncio.Lock()
         
-        # Azure OpenAI client setup
-        self.llm_client = AsyncAzureOpenAI(
-            api_key=os.getenv("api_key"),
-            azure_endpoint=os.getenv("endpoint"),
-            api_version=os.getenv("api_version")
-        )
+        # Azure OpenAI client setup (one tuned HTTP pool per process, shared by all bots)
+        self.llm_client = llm_client or get_llm_client()
 
     async def create_dynamic_bot_class(self, config: BotConfig) -> Type[BaseLLMBot]:
         """
@@ -89,28 +98,71 @@ class DynamicBotFactory:
         DynamicBot.__name__ = f"{config.bot_name}Bot"
         return DynamicBot
 
+    async def build_bot(self, config: BotConfig) -> BaseLLMBot:
+        """
+        Create and load a single bot from its configuration
+        
+        :param config: Bot configuration
+        :return: Bot instance with scenarios loaded
+        """
+        bot_class = await self.create_dynamic_bot_class(config)
+        bot = bot_class(config, self.llm_client)
+        await bot.load_scenarios()
+        # load_scenarios may have added fixed scenario context to the prefix
+        bot.compile_prompt()
+        return bot
+
     async def initialize_bots(self):
         """
         Load all active bots from database and instantiate
+
+        Bots whose configuration did not change are kept as they are, the
+        others are built concurrently. The new map is built off to the side
+        and swapped in at once, so get_bot never sees a partial registry.
+        Serialized with reload_bot.
         """
-        # Clear existing bots
-        self.bots.clear()
+        async with self.bots_lock:
+            # Fetch active bot configurations
+            bot_configs = await self.db.bot_configs.find({"is_active": True}).to_list(length=None)
+            configs = [BotConfig(**config_dict) for config_dict in bot_configs]
+            current = {bot.config.bot_id: bot for bot in self.bots.values()}
+
+            async def load(config: BotConfig):
+                existing = current.get(config.bot_id)
+                if existing and existing.config == config:
+                    return existing
+                try:
+                    return await self.build_bot(config)
+                except Exception as e:
+                    # Keep serving the previous version rather than dropping the bot
+                    print(f"Error loading bot {config.bot_name}: {e}")
+                    return existing
 
-        # Fetch active bot configurations
-        bot_configs = await self.db.bot_configs.find({"is_active": True}).to_list(length=None)
+            bots = await asyncio.gather(*(load(config) for config in configs))
+            self.bots = {bot.config.bot_description: bot for bot in bots if bot}
+
+    async def reload_bot(self, bot_id: str):
+        """
+        Load or replace a single bot by bot_id, leaving all others untouched
         
-        for config_dict in bot_configs:
-            config = BotConfig(**config_dict)
-            print(config.bot_name,"nameeees")
-            # Dynamically create bot class
-            bot_class = await self.create_dynamic_bot_class(config)
-            
-            # Instantiate the bot
-            bot = bot_class(config, self.llm_client)
-            await bot.load_scenarios()
-            
-            # Store the bot
-            self.bots[config.bot_description] = bot
+        :param bot_id: Bot ID to reload; removed if missing or inactive
+        """
+        async with self.bots_lock:
+            config_dict = await self.db.bot_configs.find_one({"bot_id": bot_id})
+            bot = None
+            if config_dict and config_dict.get("is_active", True):
+                config = BotConfig(**config_dict)
+                current = next((existing for existing in self.bots.values() if existing.config.bot_id == bot_id), None)
+                if current and current.config == config:
+                    # Already up to date (e.g. the change event for our own write)
+                    return
+                bot = await self.build_bot(config)
+
+            # Copy and swap without awaiting in between
+            bots = {key: existing for key, existing in self.bots.items() if existing.config.bot_id != bot_id}
+            if bot:
+                bots[bot.config.bot_description] = bot
+            self.bots = bots
 
     async def get_bot(self, bot_description: str) -> BaseLLMBot:
         """
@@ -138,7 +190,8 @@ class DynamicBotFactory:
             {"bot_id": bot_id}, 
             {"$set": update_data}
         )
-        await self.initialize_bots()
+        await bump_config_version(self.db)
+        await self.reload_bot(bot_id)
     
 
     async def create_dynamic_bot_analyser_class(self, config: BotConfigAnalyser) -> Type[BaseAnalyserBot]:
@@ -161,29 +214,64 @@ class DynamicBotFactory:
         DynamicBot.__name__ = f"{config.bot_name}Bot"
         return DynamicBot
 
+    async def build_bot_analyser(self, config: BotConfigAnalyser) -> BaseAnalyserBot:
+        """
+        Create and load a single analyser bot from its configuration
+        
+        :param config: Analyser bot configuration
+        :return: Analyser bot instance with scenarios loaded
+        """
+        bot_class = await self.create_dynamic_bot_analyser_class(config)
+        bot = bot_class(config, self.llm_client)
+        await bot.load_scenarios()
+        return bot
+
     async def initialize_bots_analyser(self):
         """
-        Load all active bots from database and instantiate
+        Load all active analyser bots from database and instantiate
+
+        Same incremental, swap-at-once reload as initialize_bots, into the
+        analyser registry.
         """
-        # Clear existing bots
-        self.bots.clear()
+        async with self.analysers_lock:
+            # Fetch active bot configurations
+            bot_configs = await self.db.bot_configs_analyser.find({"is_active": True}).to_list(length=None)
+            configs = [BotConfigAnalyser(**config_dict) for config_dict in bot_configs]
+            current = {bot.config.bot_id: bot for bot in self.analysers.values()}
 
-        # Fetch active bot configurations
-        bot_configs = await self.db.bot_configs_analyser.find({"is_active": True}).to_list(length=None)
+            async def load(config: BotConfigAnalyser):
+                existing = current.get(config.bot_id)
+                if existing and existing.config == config:
+                    return existing
+                try:
+                    return await self.build_bot_analyser(config)
+                except Exception as e:
+                    print(f"Error loading analyser bot {config.bot_name}: {e}")
+                    return existing
+
+            bots = await asyncio.gather(*(load(config) for config in configs))
+            self.analysers = {bot.config.bot_description: bot for bot in bots if bot}
+
+    async def reload_bot_analyser(self, bot_id: str):
+        """
+        Load or replace a single analyser bot by bot_id
         
-        for config_dict in bot_configs:
-            config = BotConfigAnalyser(**config_dict)
-            print(config.bot_name,"nameeees")
-            # Dynamically create bot class
-            bot_class = await self.create_dynamic_bot_analyser_class(config)
-            
-            # Instantiate the bot
-            bot = bot_class(config, self.llm_client)
-            print(bot)
-            await bot.load_scenarios()
-            
-            # Store the bot
-            self.bots[config.bot_description] = bot
+        :param bot_id: Bot ID to reload; removed if missing or inactive
+        """
+        async with self.analysers_lock:
+            config_dict = await self.db.bot_configs_analyser.find_one({"bot_id": bot_id})
+            bot = None
+            if config_dict and config_dict.get("is_active", True):
+                config = BotConfigAnalyser(**config_dict)
+                current = next((existing for existing in self.analysers.values() if existing.config.bot_id == bot_id), None)
+                if current and current.config == config:
+                    return
+                bot = await self.build_bot_analyser(config)
+
+            bots = {key: existing for key, existing in self.analysers.items() if existing.config.bot_id != bot_id}
+            if bot:
+                bots[bot.config.bot_description] = bot
+            self.analysers = bots
 
 
     async def get_bot_analyser(self, bot_description: str) -> BaseAnalyserBot:
@@ -193,8 +281,7 @@ class DynamicBotFactory:
         :param bot_description: Bot description identifier
         :return: Bot instance
         """
-        bot = self.bots.get(bot_description)
-        print(self.bots)
+        bot = self.analysers.get(bot_description)
         if not bot:
             raise HTTPException(status_code=404, detail="Bot not found")
         return bot
\ No newline at end of file
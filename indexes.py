@@ -0,0 +1,178 @@
+import os
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from dotenv import load_dotenv
+
+load_dotenv(".env")
+
+# Chat sessions untouched for this many days are removed by MongoDB (0 = keep forever)
+SESSION_TTL_DAYS = int(os.getenv("SESSION_TTL_DAYS", "0"))
+
+# IndexOptionsConflict / IndexKeySpecsConflict: the index exists with other options
+INDEX_CONFLICT_CODES = (85, 86)
+INDEX_NOT_FOUND = 27
+
+
+def declared_indexes() -> Dict[str, List[IndexModel]]:
+    """
+    Every index the queries in mongo.py and factory_azure.py rely on, per collection.
+
+    Names are left to MongoDB's default (field_direction) so indexes created
+    by earlier versions are recognised instead of duplicated.
+    """
+    sessions = [
+        # get_session / get_session_raw / append_messages
+        IndexModel([("session_id", ASCENDING)], unique=True),
+    ]
+    if SESSION_TTL_DAYS > 0:
+        sessions.append(IndexModel([("last_updated", ASCENDING)], expireAfterSeconds=SESSION_TTL_DAYS * 86400))
+
+    return {
+        "sessions": sessions,
+        "analysis": [
+            # get_session_analysis / save_session_analysis: one report per session
+            IndexModel([("session_id", ASCENDING)], unique=True),
+        ],
+        "analysis_jobs": [
+            # get_job
+            IndexModel([("job_id", ASCENDING)], unique=True),
+            # _claim / _reclaim_stale
+            IndexModel([("status", ASCENDING), ("created_at", ASCENDING)]),
+            # enqueue: at most one queued or running job per session
+            IndexModel([("session_id", ASCENDING)], unique=True, partialFilterExpression={"active": True}),
+        ],
+        "bot_configs": [
+            # initialize_bots / update_bot_config
+            IndexModel([("is_active", ASCENDING)]),
+            IndexModel([("bot_id", ASCENDING)], unique=True),
+        ],
+        "bot_configs_analyser": [
+            # initialize_bots_analyser
+            IndexModel([("is_active", ASCENDING)]),
+            IndexModel([("bot_id", ASCENDING)], unique=True),
+        ],
+        "question_scenarios": [
+            IndexModel([("scenario_name", ASCENDING)]),
+            # get_scenario_questions / get_scenario_context
+            IndexModel([("scenario_name", ASCENDING), ("is_active", ASCENDING)]),
+        ],
+        "question_chat_sessions": [
+            # get_question_session / update_question_session
+            IndexModel([("session_id", ASCENDING)]),
+            IndexModel([("scenario_name", ASCENDING)]),
+            IndexModel([("created_at", DESCENDING)]),
+            # get_session_analytics
+            IndexModel([("scenario_name", ASCENDING), ("created_at", DESCENDING)]),
+            # get_question_session_by_conversation
+            IndexModel([("last_updated", DESCENDING)]),
+        ],
+        "question_session_daily": [
+            # _rollup_session_analytics / _count_*_session / rebuild_session_rollups ($merge needs it unique)
+            IndexModel([("scenario_name", ASCENDING), ("day", ASCENDING)], unique=True),
+        ],
+        "paraphrased_questions": [
+            IndexModel([("original_question_id", ASCENDING), ("scenario_name", ASCENDING), ("difficulty", ASCENDING)]),
+            # get_paraphrases_bulk / delete_scenario_paraphrases
+            IndexModel([("scenario_name", ASCENDING), ("difficulty", ASCENDING)]),
+        ],
+        "paraphrase_jobs": [
+            # get_job / resume
+            IndexModel([("job_id", ASCENDING)], unique=True),
+        ],
+    }
+
+
+async def ensure_indexes(db) -> Dict[str, Dict[str, str]]:
+    """
+    Create every declared index that does not exist yet.
+
+    Each index is created on its own so one conflict (e.g. duplicate values
+    under a unique index) does not stop the rest. Returns the outcome per
+    collection and index name.
+    """
+    results = {}
+    for collection_name, models in declared_indexes().items():
+        collection = db[collection_name]
+        results[collection_name] = {}
+        for model in models:
+            name = model.document["name"]
+            try:
+                await collection.create_indexes([model])
+                results[collection_name][name] = "ok"
+            except OperationFailure as e:
+                if e.code in INDEX_CONFLICT_CODES and model.document.get("unique"):
+                    results[collection_name][name] = await _make_unique(collection, model)
+                    continue
+                print(f"Error creating index {collection_name}.{name}: {e}")
+                results[collection_name][name] = f"error: {e}"
+    return results
+
+
+async def _make_unique(collection, model: IndexModel) -> str:
+    """
+    Replace an existing non-unique index with its declared unique version.
+
+    Only done when the collection has no duplicate keys; otherwise the old
+    index is left in place and the duplicates have to be cleaned up first.
+    Workers starting together may race on it, so failures are returned as
+    results like any other index error rather than raised.
+    """
+    name = model.document["name"]
+    fields = list(model.document["key"].keys())
+    group_id = {field.replace(".", "_"): f"${field}" for field in fields}
+    duplicates = await collection.aggregate([
+        {"$group": {"_id": group_id, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": 1}
+    ]).to_list(length=1)
+    if duplicates:
+        message = f"error: duplicate values {duplicates[0]['_id']} block unique index"
+        print(f"Error upgrading index {collection.name}.{name}: {message}")
+        return message
+    try:
+        try:
+            await collection.drop_index(name)
+        except OperationFailure as e:
+            # Another worker dropped it first; creating it is still up to whoever gets there
+            if e.code != INDEX_NOT_FOUND:
+                raise
+        await collection.create_indexes([model])
+    except OperationFailure as e:
+        message = f"error: {e}"
+        print(f"Error upgrading index {collection.name}.{name}: {message}")
+        return message
+    print(f"Upgraded index {collection.name}.{name} to unique")
+    return "upgraded to unique"
+
+
+async def index_report(db) -> Dict[str, Dict]:
+    """
+    Compare declared indexes with what the database has.
+
+    missing: declared but not present. undeclared: present but not declared.
+    unused: present with no recorded accesses since the server started
+    (from $indexStats, so the numbers reset on restart).
+    """
+    report = {}
+    for collection_name, models in declared_indexes().items():
+        collection = db[collection_name]
+        declared = [model.document["name"] for model in models]
+        existing = await collection.index_information()
+
+        usage = {}
+        try:
+            async for stats in collection.aggregate([{"$indexStats": {}}]):
+                usage[stats["name"]] = stats["accesses"]["ops"]
+        except OperationFailure as e:
+            print(f"Error reading index stats for {collection_name}: {e}")
+
+        report[collection_name] = {
+            "declared": declared,
+            "missing": [name for name in declared if name not in existing],
+            "undeclared": [name for name in existing if name != "_id_" and name not in declared],
+            "unused": [name for name in existing if name != "_id_" and usage.get(name) == 0],
+            "usage": usage
+        }
+    return report
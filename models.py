@@ -19,6 +19,46 @@ class ChatSession(BaseModel):
     conversation_history: List[Message]
     created_at: datetime = datetime.now()
     last_updated: datetime = datetime.now()
+    # Rolling summary of the first summary_upto messages (see context_window.py)
+    summary: Optional[str] = None
+    summary_upto: int = 0
+
+class SessionView(BaseModel):
+    """
+    Part of a chat session: metadata plus the last messages of its history.
+
+    conversation_history holds messages history_offset .. message_count - 1
+    of the full history; summary_upto counts from the start of the full history.
+    """
+    session_id: str
+    scenario_name: str
+    conversation_history: List[Message] = []
+    history_offset: int = 0
+    message_count: int = 0
+    summary: Optional[str] = None
+    summary_upto: int = 0
+
+# Hot path: a document read back from MongoDB is turned into models with one
+# model_validate call, which runs entirely in pydantic-core and is faster than
+# model_construct (pure Python) for models this small; see
+# benchmarks/bench_message_hot_path.py. Messages are written as plain dicts
+# instead of through .dict().
+
+def message_from_document(doc: Dict) -> Message:
+    if doc.get("timestamp") is None:
+        doc = {**doc, "timestamp": datetime.now()}
+    return Message.model_validate(doc)
+
+def message_document(message: Message) -> Dict:
+    return {"role": message.role, "content": message.content, "timestamp": message.timestamp}
+
+def session_from_document(doc: Dict) -> ChatSession:
+    return ChatSession.model_validate({
+        **doc,
+        "extra": doc.get("extra", ""),
+        "conversation_history": doc.get("conversation_history") or [],
+        "summary_upto": doc.get("summary_upto") or 0
+    })
 
 class ChatRequest(BaseModel):
     message: str = Form(...)
@@ -40,6 +80,8 @@ class ChatReport(BaseModel):
     category_scores: Dict[str, float]
     detailed_feedback: Dict[str, List[str]]
     recommendations: List[str]
+    # Length of the conversation the report was computed from (None for older reports)
+    message_count: Optional[int] = None
     
 class BotConfig(BaseModel):
     """
@@ -54,6 +96,7 @@ class BotConfig(BaseModel):
     is_active: bool = True
     bot_class: Optional[str] = None
     llm_model: str
+    opening_lines: List[str] = []  # Fixed lines the bot opens with; pre-synthesized into the TTS cache
 
 class BotConfigAnalyser(BaseModel):
     """
@@ -87,6 +130,10 @@ class ParaphrasingRequest(BaseModel):
     question_ids: Optional[List[str]] = None  # If None, paraphrase all questions
     force_regenerate: bool = False  # Regenerate even if paraphrases exist
 
+class AnalysisBatchRequest(BaseModel):
+    """Request model for queueing session analyses"""
+    session_ids: List[str]
+
 class QuestionAttemptRecord(BaseModel):
     question_id: str
     original_question: Dict  # Original question from database
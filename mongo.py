@@ -4,6 +4,7 @@ from pydantic import BaseModel, Field
 from motor.motor_asyncio import AsyncIOMotorClient
 from fastapi import FastAPI, HTTPException, Depends
 import importlib
+import copy
 import inspect
 from fastapi import FastAPI, HTTPException, Depends, Form
 from pydantic import BaseModel,Field
@@ -24,10 +25,24 @@ import time
 import base64
 from models import (
     Message, ChatSession, ChatResponse, ChatReport, BotConfig, BotConfigAnalyser,
-    QuestionScenarioDoc, ParaphrasedQuestionCache, QuestionSession)
+    QuestionScenarioDoc, ParaphrasedQuestionCache, QuestionSession, SessionView,
+    message_from_document, message_document, session_from_document)
+from indexes import ensure_indexes, index_report
+from config_sync import bump_config_version
+from clients import get_motor_client
+from paraphrase_cache import paraphrase_cache
+from pymongo.errors import DuplicateKeyError
+
+
+def rollup_day(moment: datetime) -> str:
+    """Day key of the question session rollups (same format as $dateToString %Y-%m-%d)"""
+    return moment.strftime("%Y-%m-%d")
+
+
 class MongoDB:
-    def __init__(self,MONGO_URL,DATABASE_NAME):
-        self.client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URL)
+    def __init__(self,MONGO_URL,DATABASE_NAME,client=None):
+        # Shared per-process motor client unless one is injected
+        self.client = client or get_motor_client(MONGO_URL)
         self.db = self.client[DATABASE_NAME]
         self.sessions = self.db.sessions
         self.analysis=self.db.analysis
@@ -37,17 +52,72 @@ class MongoDB:
         # self.question_scenarios = self.db.question_scenarios
         # self.question_chat_sessions = self.db.question_chat_sessions  
         # self.paraphrased_questions = self.db.paraphrased_questions
+        # First day the question session rollups count fully ("" = all days, None = not looked up yet)
+        self._rollups_from: Optional[str] = None
         
     async def create_session(self, session: ChatSession) -> str:
         await self.sessions.insert_one(session.dict())
         return session.session_id
     async def create_conversation_analysis(self,report:ChatReport) -> str:
         await self.analysis.insert_one(report.dict())
+    async def save_session_analysis(self, report: ChatReport):
+        # One report per session (unique index); a newer analysis replaces the old one
+        try:
+            await self.analysis.replace_one({"session_id": report.session_id}, report.dict(), upsert=True)
+        except DuplicateKeyError:
+            # Two workers upserted the same new session at once; the other insert won
+            await self.analysis.replace_one({"session_id": report.session_id}, report.dict())
     async def get_session(self, session_id: str) -> Optional[ChatSession]:
         session_data = await self.sessions.find_one({"session_id": session_id})
         if session_data:
-            return ChatSession(**session_data)
+            return session_from_document(session_data)
         return None
+    async def get_session_view(self, session_id: str, last_n: Optional[int] = None) -> Optional[SessionView]:
+        """
+        Session metadata plus only the last last_n messages (None = all, 0 = none).
+
+        The history is cut down with $slice on the server, so the read and the
+        parse stay the same size however long the session is.
+        """
+        project = {
+            "_id": 0,
+            "session_id": 1,
+            "scenario_name": 1,
+            "summary": 1,
+            "summary_upto": 1,
+            "message_count": {"$size": {"$ifNull": ["$conversation_history", []]}}
+        }
+        if last_n is None:
+            project["conversation_history"] = 1
+        elif last_n > 0:
+            project["conversation_history"] = {"$slice": [{"$ifNull": ["$conversation_history", []]}, -last_n]}
+        docs = await self.sessions.aggregate([
+            {"$match": {"session_id": session_id}},
+            {"$limit": 1},
+            {"$project": project}
+        ]).to_list(length=1)
+        if not docs:
+            return None
+        doc = docs[0]
+        history = doc.get("conversation_history") or []
+        return SessionView.model_validate({
+            "session_id": doc["session_id"],
+            "scenario_name": doc["scenario_name"],
+            "conversation_history": history,
+            "history_offset": doc["message_count"] - len(history),
+            "message_count": doc["message_count"],
+            "summary": doc.get("summary"),
+            "summary_upto": doc.get("summary_upto") or 0
+        })
+    async def get_messages(self, session_id: str, start: int, count: int) -> List[Message]:
+        """Messages start .. start + count - 1 of a session's history"""
+        doc = await self.sessions.find_one(
+            {"session_id": session_id},
+            {"_id": 0, "conversation_history": {"$slice": [start, count]}}
+        )
+        if not doc:
+            return []
+        return [message_from_document(message) for message in doc.get("conversation_history") or []]
     async def get_session_raw(self, session_id: str) -> Optional[ChatSession]:
         session_data = await self.sessions.find_one({"session_id": session_id})
         if session_data:
@@ -64,15 +134,38 @@ class MongoDB:
             {"session_id": session.session_id},
             {"$set": session.dict()}
         )
+    async def set_session_summary(self, session_id: str, summary: str, summary_upto: int) -> bool:
+        """Store a rolling summary unless one covering as many messages is already stored"""
+        result = await self.sessions.update_one(
+            {"session_id": session_id, "summary_upto": {"$not": {"$gte": summary_upto}}},
+            {"$set": {"summary": summary, "summary_upto": summary_upto}}
+        )
+        return result.modified_count == 1
+    async def append_messages(self, session_id: str, messages: List[Message]):
+        """
+        Append messages to a session's conversation history.
+
+        Only the new messages are sent ($push), so the write size stays the
+        same however long the conversation gets.
+        """
+        await self.sessions.update_one(
+            {"session_id": session_id},
+            {
+                "$push": {"conversation_history": {"$each": [message_document(message) for message in messages]}},
+                "$set": {"last_updated": datetime.now()}
+            }
+        )
     async def create_bot(self,bot_config:BotConfig):
         bot= await self.bot_configs.insert_one(bot_config.dict())
         if bot :
+            await bump_config_version(self.db)
             return bot
         else:
             HTTPException(status_code=400,detail="Error creating Bot")
     async def create_bot_analyser(self,bot_config:BotConfigAnalyser):
         bot= await self.bot_configs_analyser.insert_one(bot_config.dict())
         if bot :
+            await bump_config_version(self.db)
             return bot
         else:
             HTTPException(status_code=400,detail="Error creating Bot")
@@ -104,11 +197,16 @@ class MongoDB:
         """Save or update question session"""
         try:
             session.last_updated = datetime.now()
-            await self.question_chat_sessions.update_one(
+            result = await self.question_chat_sessions.update_one(
                 {"session_id": session.session_id},
                 {"$set": session.dict()},
                 upsert=True
             )
+            # Same rollup accounting as create_question_session / update_question_session
+            if result.upserted_id is not None:
+                await self._count_started_session(session)
+            if session.is_completed:
+                await self._count_completed_session(session)
         except Exception as e:
             print(f"Error saving question session: {e}")
             raise
@@ -136,6 +234,8 @@ class MongoDB:
             {"session_id": session.session_id},
             {"$set": session.dict()}
             )
+            if session.is_completed:
+                await self._count_completed_session(session)
             print(f"Updated question session: {session.session_id}")
         except Exception as e:
             print(f"Error updating question session: {e}")
@@ -160,6 +260,9 @@ class MongoDB:
         try:
             collection = self.db["question_chat_sessions"]
             await collection.insert_one(session.dict())
+            await self._count_started_session(session)
+            if session.is_completed:
+                await self._count_completed_session(session)
             print(f"Created question session: {session.session_id}")
         except Exception as e:
             print(f"Error creating question session: {e}")
@@ -194,16 +297,36 @@ class MongoDB:
             print(f"Error creating question scenario: {e}")
             raise
 
+    async def get_paraphrases_bulk(self, scenario_name: str, difficulty: str,
+                                   question_ids: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """
+        Paraphrases of a scenario and difficulty as original_question_id -> paraphrased_data.
+
+        One projected query loads the whole set into the process-local
+        paraphrase cache; question_ids only filters the result. With the
+        cache disabled, question_ids are fetched with a single $in query.
+        """
+        paraphrases = paraphrase_cache.get(scenario_name, difficulty)
+        if paraphrases is None:
+            query = {"scenario_name": scenario_name, "difficulty": difficulty, "is_active": True}
+            if question_ids is not None and not paraphrase_cache.enabled:
+                query["original_question_id"] = {"$in": list(question_ids)}
+            cursor = self.paraphrased_questions.find(
+                query, {"_id": 0, "original_question_id": 1, "paraphrased_data": 1}
+            ).sort("created_at", 1)
+            # Oldest first, so the newest paraphrase of a question wins
+            paraphrases = {doc["original_question_id"]: doc["paraphrased_data"] async for doc in cursor}
+            paraphrase_cache.put(scenario_name, difficulty, paraphrases)
+        # Copies: callers shuffle and edit options, and the cached dicts are shared by the process
+        if question_ids is None:
+            return copy.deepcopy(paraphrases)
+        return {qid: copy.deepcopy(paraphrases[qid]) for qid in question_ids if qid in paraphrases}
+
     async def get_paraphrased_question(self, original_question_id: str, scenario_name: str, difficulty: str) -> Optional[Dict]:
-        """Get cached paraphrased question"""
+        """Get cached paraphrased question (served from the bulk paraphrase cache)"""
         try:
-            cached = await self.paraphrased_questions.find_one({
-                "original_question_id": original_question_id,
-                "scenario_name": scenario_name,
-                "difficulty": difficulty,
-                "is_active": True
-            })
-            return cached["paraphrased_data"] if cached else None
+            paraphrases = await self.get_paraphrases_bulk(scenario_name, difficulty, [original_question_id])
+            return paraphrases.get(original_question_id)
         except Exception as e:
             print(f"Error getting paraphrased question: {e} hererer")
             return None
@@ -212,6 +335,9 @@ class MongoDB:
         """Save paraphrased question to cache"""
         try:
             await self.paraphrased_questions.insert_one(cache_doc.dict())
+            if cache_doc.is_active:
+                paraphrase_cache.update(cache_doc.scenario_name, cache_doc.difficulty,
+                                        cache_doc.original_question_id, cache_doc.paraphrased_data)
         except Exception as e:
             print(f"Error saving paraphrased question: {e}")
             raise
@@ -224,60 +350,220 @@ class MongoDB:
                 query["difficulty"] = difficulty
                 
             result = await self.paraphrased_questions.delete_many(query)
+            paraphrase_cache.invalidate(scenario_name, difficulty)
             return result.deleted_count
         except Exception as e:
             print(f"Error deleting paraphrases: {e}")
             return 0
 
-    async def get_session_analytics(self, scenario_name: str, days: int = 7) -> Dict:
-        """Get basic analytics for question sessions"""
+    async def get_session_analytics(self, scenario_name: str, days: int = 7, exact: bool = False) -> Dict:
+        """
+        Get basic analytics for question sessions created in the last `days` days.
+
+        Reads the per-day rollups (a handful of small documents) by counting
+        whole calendar days, today included. exact=True aggregates the
+        sessions themselves over the rolling window instead, which is also
+        what is used while the rollups do not cover the window yet.
+        """
         try:
-            from datetime import timedelta
-            start_date = datetime.now() - timedelta(days=days)
-            
-            sessions = await self.question_chat_sessions.find({
-                "scenario_name": scenario_name,
-                "created_at": {"$gte": start_date}
-            }).to_list(length=None)
-            
-            total_sessions = len(sessions)
-            completed_sessions = [s for s in sessions if s.get("is_completed", False)]
-            
-            return {
-                "total_sessions": total_sessions,
-                "completed_sessions": len(completed_sessions),
-                "completion_rate": len(completed_sessions) / total_sessions * 100 if total_sessions > 0 else 0,
-                "average_score": sum(s["score"] for s in completed_sessions) / len(completed_sessions) if completed_sessions else 0
-            }
+            if exact or not await self._rollups_cover(days):
+                return await self._aggregate_session_analytics(scenario_name, days)
+            return await self._rollup_session_analytics(scenario_name, days)
         except Exception as e:
             print(f"Error getting session analytics: {e}")
             return {"error": str(e)}
 
+    @staticmethod
+    def _analytics(total: int, completed: int, score_sum: float) -> Dict:
+        return {
+            "total_sessions": total,
+            "completed_sessions": completed,
+            "completion_rate": completed / total * 100 if total > 0 else 0,
+            "average_score": score_sum / completed if completed else 0
+        }
+
+    async def _aggregate_session_analytics(self, scenario_name: str, days: int) -> Dict:
+        from datetime import timedelta
+        start_date = datetime.now() - timedelta(days=days)
+        completed = {"$eq": ["$is_completed", True]}
+        rows = await self.question_chat_sessions.aggregate([
+            {"$match": {"scenario_name": scenario_name, "created_at": {"$gte": start_date}}},
+            {"$group": {
+                "_id": None,
+                "total": {"$sum": 1},
+                "completed": {"$sum": {"$cond": [completed, 1, 0]}},
+                "score_sum": {"$sum": {"$cond": [completed, {"$ifNull": ["$score", 0]}, 0]}}
+            }}
+        ]).to_list(length=1)
+        row = rows[0] if rows else {"total": 0, "completed": 0, "score_sum": 0}
+        return self._analytics(row["total"], row["completed"], row["score_sum"])
+
+    async def _rollup_session_analytics(self, scenario_name: str, days: int) -> Dict:
+        from datetime import timedelta
+        today = datetime.now()
+        day_keys = [rollup_day(today - timedelta(days=n)) for n in range(days - 1, -1, -1)]
+        docs = await self.question_session_daily.find(
+            {"scenario_name": scenario_name, "day": {"$gte": day_keys[0]}},
+            {"_id": 0, "day": 1, "started": 1, "completed": 1, "score_sum": 1}
+        ).to_list(length=days)
+        by_day = {doc["day"]: doc for doc in docs}
+
+        daily = []
+        for day in day_keys:
+            doc = by_day.get(day, {})
+            daily.append({"day": day, **self._analytics(doc.get("started", 0), doc.get("completed", 0), doc.get("score_sum", 0))})
+        totals = self._analytics(
+            sum(d["total_sessions"] for d in daily),
+            sum(d["completed_sessions"] for d in daily),
+            sum(by_day.get(d["day"], {}).get("score_sum", 0) for d in daily)
+        )
+        return {**totals, "daily": daily}
+
+    async def _rollups_cover(self, days: int) -> bool:
+        """
+        Whether the rollups count every session of the last `days` calendar days.
+
+        Until rebuild_session_rollups has run, they only count sessions from
+        the first rollup day on, and that day only partly (sessions before
+        the deploy are missing), so the window has to start after it.
+        """
+        from datetime import timedelta
+        if self._rollups_from is None:
+            state = await self.db["rollup_state"].find_one({"_id": "question_session_daily"})
+            if state:
+                self._rollups_from = ""
+            else:
+                first = await self.question_session_daily.find_one({}, {"day": 1}, sort=[("day", 1)])
+                if not first:
+                    return False
+                self._rollups_from = first["day"]
+        if not self._rollups_from:
+            return True
+        return self._rollups_from < rollup_day(datetime.now() - timedelta(days=days - 1))
+
+    @property
+    def question_session_daily(self):
+        """Per scenario, per day counters of question sessions (see _count_*_session)"""
+        return self.db["question_session_daily"]
+
+    async def _count_started_session(self, session: "QuestionSession"):
+        await self.question_session_daily.update_one(
+            {"scenario_name": session.scenario_name, "day": rollup_day(session.created_at)},
+            {"$inc": {"started": 1}},
+            upsert=True
+        )
+
+    async def _count_completed_session(self, session: "QuestionSession"):
+        """Count a completed session once; rollup_counted guards against repeated updates"""
+        claimed = await self.question_chat_sessions.update_one(
+            {"session_id": session.session_id, "is_completed": True, "rollup_counted": {"$ne": True}},
+            {"$set": {"rollup_counted": True}}
+        )
+        if claimed.modified_count:
+            await self.question_session_daily.update_one(
+                {"scenario_name": session.scenario_name, "day": rollup_day(session.created_at)},
+                {"$inc": {"completed": 1, "score_sum": session.score}},
+                upsert=True
+            )
+
+    async def rebuild_session_rollups(self) -> int:
+        """
+        Recompute every daily rollup from the sessions themselves.
+
+        Run once after deploying the rollups (sessions created before they
+        existed are not counted otherwise; analytics use the exact
+        aggregation for windows the rollups do not cover until then) or to
+        repair drift. Days that no longer have sessions are removed. Sessions
+        completing while it runs may be counted twice.
+        """
+        rebuilt_at = datetime.now()
+        await self.question_chat_sessions.update_many(
+            {"is_completed": True, "rollup_counted": {"$ne": True}},
+            {"$set": {"rollup_counted": True}}
+        )
+        completed = {"$eq": ["$is_completed", True]}
+        await self.question_chat_sessions.aggregate([
+            {"$group": {
+                "_id": {
+                    "scenario_name": "$scenario_name",
+                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
+                },
+                "started": {"$sum": 1},
+                "completed": {"$sum": {"$cond": [completed, 1, 0]}},
+                "score_sum": {"$sum": {"$cond": [completed, {"$ifNull": ["$score", 0]}, 0]}}
+            }},
+            {"$project": {
+                "_id": 0,
+                "scenario_name": "$_id.scenario_name",
+                "day": "$_id.day",
+                "started": 1,
+                "completed": 1,
+                "score_sum": 1,
+                "rebuilt_at": {"$literal": rebuilt_at}
+            }},
+            {"$merge": {
+                "into": "question_session_daily",
+                "on": ["scenario_name", "day"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }}
+        ], allowDiskUse=True).to_list(length=None)
+        # Not written by the merge: their sessions are gone. Today is left alone, since
+        # _count_started_session may have created a day after the merge read the sessions
+        await self.question_session_daily.delete_many(
+            {"rebuilt_at": {"$ne": rebuilt_at}, "day": {"$lt": rollup_day(rebuilt_at)}}
+        )
+        await self.db["rollup_state"].update_one(
+            {"_id": "question_session_daily"},
+            {"$set": {"rebuilt_at": rebuilt_at}},
+            upsert=True
+        )
+        self._rollups_from = ""
+        return await self.question_session_daily.count_documents({})
+
     # Index creation for performance
     async def create_indexes(self):
-        """Create database indexes for better performance"""
+        """Create every index declared in indexes.py that does not exist yet"""
         try:
-            # Question scenarios indexes
-            await self.question_scenarios.create_index("scenario_name")
-            await self.question_scenarios.create_index([("scenario_name", 1), ("is_active", 1)])
-            
-            # Question sessions indexes  
-            await self.question_chat_sessions.create_index("session_id")
-            await self.question_chat_sessions.create_index("scenario_name")
-            await self.question_chat_sessions.create_index([("created_at", -1)])
-            
-            # Paraphrased questions indexes
-            await self.paraphrased_questions.create_index([
-                ("original_question_id", 1), 
-                ("scenario_name", 1), 
-                ("difficulty", 1)
-            ])
-            await self.paraphrased_questions.create_index([("scenario_name", 1), ("difficulty", 1)])
-            
-            print("Database indexes created successfully")
-            
+            results = await ensure_indexes(self.db)
         except Exception as e:
+            # Missing indexes make queries slower, not wrong; do not keep the worker from starting
             print(f"Error creating indexes: {e}")
+            return {}
+        failed = [f"{c}.{n}" for c, names in results.items() for n, r in names.items() if r.startswith("error")]
+        if failed:
+            print(f"Database indexes created with errors: {failed}")
+            if any(name.startswith("analysis.session_id") for name in failed):
+                print("Duplicate session analyses block analysis.session_id; "
+                      "run POST /gt/api/admin/analyses/deduplicate once, then restart")
+        else:
+            print("Database indexes created successfully")
+        return results
+
+    async def remove_duplicate_analyses(self) -> int:
+        """
+        Keep only the newest report per session.
+
+        Racing analyses used to insert several reports per session, which
+        blocks the unique analysis.session_id index. A one-off migration:
+        it scans the whole collection, so it is run by hand, not at startup.
+        """
+        removed = 0
+        duplicates = self.analysis.aggregate([
+            {"$sort": {"timestamp": -1}},
+            {"$group": {"_id": "$session_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allowDiskUse=True)
+        async for group in duplicates:
+            result = await self.analysis.delete_many({"_id": {"$in": group["ids"][1:]}})
+            removed += result.deleted_count
+        if removed:
+            print(f"Removed {removed} duplicate session analyses")
+        return removed
+
+    async def index_report(self):
+        """Missing, undeclared and unused indexes per collection"""
+        return await index_report(self.db)
 
     # Data validation helpers
     def validate_question_structure(question: Dict) -> bool:
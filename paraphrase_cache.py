@@ -0,0 +1,82 @@
+import copy
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv(".env")
+
+
+class ParaphraseCache:
+    """
+    Process-local cache of every paraphrase of a (scenario, difficulty).
+
+    Each entry is the complete map original_question_id -> paraphrased_data,
+    loaded with one query, so a question session needs one round trip (or
+    none) however many questions it has. Saves update the cached map and
+    deletes drop it; other workers see changes once their entry expires
+    after `ttl` seconds.
+    """
+
+    def __init__(self, max_entries: int = 200, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()  # key -> (paraphrases, loaded_at)
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @classmethod
+    def from_env(cls) -> "ParaphraseCache":
+        return cls(
+            max_entries=int(os.getenv("PARAPHRASE_CACHE_SIZE", "200")),
+            ttl=float(os.getenv("PARAPHRASE_CACHE_TTL", "300"))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, scenario_name: str, difficulty: str) -> Optional[Dict[str, Dict]]:
+        """The cached map itself, not a copy; do not hand its values out to callers"""
+        key = (scenario_name, difficulty)
+        entry = self.entries.get(key)
+        if entry and time.monotonic() - entry[1] <= self.ttl:
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[0]
+        self.counters["misses"] += 1
+        return None
+
+    def put(self, scenario_name: str, difficulty: str, paraphrases: Dict[str, Dict]):
+        if not self.enabled:
+            return
+        key = (scenario_name, difficulty)
+        self.entries[key] = (paraphrases, time.monotonic())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def update(self, scenario_name: str, difficulty: str, question_id: str, paraphrased_data: Dict):
+        """Apply a newly saved paraphrase to the cached map, if the map is cached"""
+        entry = self.entries.get((scenario_name, difficulty))
+        if entry:
+            # The caller keeps its dict; later edits to it must not reach the cache
+            entry[0][question_id] = copy.deepcopy(paraphrased_data)
+
+    def invalidate(self, scenario_name: str, difficulty: Optional[str] = None):
+        for key in [k for k in self.entries if k[0] == scenario_name and (difficulty is None or k[1] == difficulty)]:
+            del self.entries[key]
+            self.counters["invalidations"] += 1
+
+    def stats(self) -> Dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_ratio": self.counters["hits"] / lookups if lookups else 0,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries
+        }
+
+
+paraphrase_cache = ParaphraseCache.from_env()
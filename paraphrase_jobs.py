@@ -0,0 +1,281 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument, UpdateOne
+
+from admission import admission, BACKGROUND
+from models import ParaphrasingRequest
+from mongo import MongoDB
+from paraphrase_cache import paraphrase_cache
+
+DIFFICULTIES = ("easy", "hard")
+
+PARAPHRASE_PROMPT = """You rewrite multiple-choice training questions so that learners who retake a
+scenario do not see the same wording twice.
+
+Scenario context:
+{context}
+
+Difficulty: {difficulty}. {difficulty_rule}
+
+Rewrite the question and each option. Keep the meaning, the facts, the number of
+options and their order exactly, so the correct answer stays {correct_answer}.
+Respond with a JSON object: {{"question_text": "...", "options": ["...", "..."]}}"""
+
+DIFFICULTY_RULES = {
+    "easy": "Use short, plain sentences and everyday words.",
+    "hard": "Use precise professional wording and make the wrong options read as plausibly as the right one."
+}
+
+
+class ParaphraseJobRunner:
+    """
+    Offline generation of the paraphrased question cache.
+
+    A job takes a ParaphrasingRequest and paraphrases the scenario's
+    questions (or request.question_ids) with at most `concurrency` LLM calls
+    at once, at background admission priority. Questions that already have
+    a paraphrase are skipped unless force_regenerate is set. Results are
+    written every `batch_size` questions with one bulk_write of upserts,
+    and the job document in paraphrase_jobs records which questions are done
+    or failed. A job that was interrupted or left failures can be resumed
+    and only does the remaining questions.
+    """
+
+    def __init__(self, db: MongoDB, bot_factory, llm_client, concurrency: int = 4, batch_size: int = 20,
+                 model: Optional[str] = None, stale_after: float = 600.0):
+        self.db = db
+        self.jobs = db.db.paraphrase_jobs
+        self.bot_factory = bot_factory
+        self.llm_client = llm_client
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.model = model
+        self.stale_after = stale_after
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    @classmethod
+    def from_env(cls, db: MongoDB, bot_factory, llm_client) -> "ParaphraseJobRunner":
+        return cls(
+            db,
+            bot_factory,
+            llm_client,
+            concurrency=int(os.getenv("PARAPHRASE_CONCURRENCY", "4")),
+            batch_size=int(os.getenv("PARAPHRASE_BATCH_SIZE", "20")),
+            model=os.getenv("PARAPHRASE_MODEL") or None,
+            stale_after=float(os.getenv("PARAPHRASE_JOB_STALE", "600"))
+        )
+
+    @staticmethod
+    def _public(job: Optional[dict]) -> Optional[dict]:
+        if not job:
+            return None
+        job.pop("_id", None)
+        total = len(job.pop("question_ids", []))
+        done = len(job.pop("done_ids", []))
+        job["progress"] = {
+            "total": total,
+            "done": done,
+            "failed": len(job.get("failed", {})),
+            "percent": round(done / total * 100, 1) if total else 100.0
+        }
+        return job
+
+    async def start(self, request: ParaphrasingRequest) -> dict:
+        if request.difficulty_level not in DIFFICULTIES:
+            raise HTTPException(status_code=400, detail=f"difficulty_level must be one of {DIFFICULTIES}")
+        # Fails with 404 before anything is queued when the scenario has no bot
+        await self._model(request.scenario_name)
+        questions = await self.db.get_scenario_questions(request.scenario_name)
+        if not questions:
+            raise HTTPException(status_code=404, detail="Scenario has no questions")
+
+        question_ids = [q["id"] for q in questions if "id" in q]
+        if request.question_ids is not None:
+            wanted = set(request.question_ids)
+            question_ids = [qid for qid in question_ids if qid in wanted]
+        # Without an id a paraphrase cannot be stored against its question
+        failed = {f"#{index}": "Question has no id" for index, q in enumerate(questions) if "id" not in q}
+        skipped = 0
+        if not request.force_regenerate:
+            existing = await self.db.get_paraphrases_bulk(request.scenario_name, request.difficulty_level)
+            skipped = sum(1 for qid in question_ids if qid in existing)
+            question_ids = [qid for qid in question_ids if qid not in existing]
+
+        now = datetime.now()
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "scenario_name": request.scenario_name,
+            "difficulty": request.difficulty_level,
+            "force_regenerate": request.force_regenerate,
+            "status": "running" if question_ids else "partial" if failed else "done",
+            "question_ids": question_ids,
+            "done_ids": [],
+            "failed": failed,
+            "skipped_existing": skipped,
+            "created_at": now,
+            "updated_at": now
+        }
+        await self.jobs.insert_one(dict(job))
+        if question_ids:
+            self._spawn(job["job_id"])
+        return self._public(job)
+
+    async def resume(self, job_id: str) -> dict:
+        """Continue an interrupted, stale or partly failed job with its remaining questions"""
+        if job_id in self.tasks:
+            # Slow (e.g. waiting for background admission), not dead
+            raise HTTPException(status_code=409, detail="Job is still running in this worker")
+        stale = datetime.now() - timedelta(seconds=self.stale_after)
+        job = await self.jobs.find_one_and_update(
+            {"job_id": job_id, "$or": [
+                {"status": {"$in": ["interrupted", "partial", "failed"]}},
+                {"status": "running", "updated_at": {"$lt": stale}}
+            ]},
+            {"$set": {"status": "running", "updated_at": datetime.now()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not job:
+            existing = await self.jobs.find_one({"job_id": job_id})
+            if not existing:
+                raise HTTPException(status_code=404, detail="Job not found")
+            raise HTTPException(status_code=409, detail=f"Job is {existing['status']}; nothing to resume")
+        self._spawn(job_id)
+        return self._public(job)
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        return self._public(await self.jobs.find_one({"job_id": job_id}))
+
+    def _spawn(self, job_id: str):
+        task = asyncio.create_task(self._run(job_id))
+        self.tasks[job_id] = task
+
+        def forget(done: asyncio.Task):
+            # A resumed job may already have a newer task under this id
+            if self.tasks.get(job_id) is done:
+                del self.tasks[job_id]
+        task.add_done_callback(forget)
+
+    async def stop(self):
+        """Mark running jobs of this process interrupted so they can be resumed"""
+        for job_id, task in list(self.tasks.items()):
+            task.cancel()
+            await self.jobs.update_one(
+                {"job_id": job_id, "status": "running"},
+                {"$set": {"status": "interrupted", "updated_at": datetime.now()}}
+            )
+        self.tasks = {}
+
+    async def _model(self, scenario_name: str) -> str:
+        if self.model:
+            return self.model
+        # Scenarios are named after the bot that runs them (bot_description)
+        bot = await self.bot_factory.get_bot(scenario_name)
+        return bot.llm_model
+
+    async def _paraphrase(self, model: str, context: str, difficulty: str, question: Dict) -> Dict:
+        prompt = PARAPHRASE_PROMPT.format(
+            context=context or "(none)",
+            difficulty=difficulty,
+            difficulty_rule=DIFFICULTY_RULES[difficulty],
+            correct_answer=question["correct_answer"]
+        )
+        original = {"question_text": question["question_text"], "options": question["options"]}
+        response, permit = await admission.create(
+            self.llm_client,
+            model,
+            [
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": json.dumps(original, ensure_ascii=False)}
+            ],
+            max_tokens=800,
+            priority=BACKGROUND,
+            temperature=0.7,
+            response_format={"type": "json_object"}
+        )
+        permit.release()
+        result = json.loads(response.choices[0].message.content)
+        options = result.get("options")
+        if not isinstance(result.get("question_text"), str) or not isinstance(options, list) \
+                or len(options) != len(question["options"]):
+            raise ValueError("Paraphrase does not keep the question's shape")
+        return {
+            "question_text": result["question_text"],
+            "options": [str(option) for option in options],
+            "correct_answer": question["correct_answer"],
+            "explanation": question.get("explanation"),
+            "difficulty": difficulty
+        }
+
+    async def _run(self, job_id: str):
+        job = await self.jobs.find_one({"job_id": job_id})
+        scenario_name, difficulty = job["scenario_name"], job["difficulty"]
+        try:
+            model = await self._model(scenario_name)
+            context = await self.db.get_scenario_context(scenario_name)
+            questions = {q["id"]: q for q in await self.db.get_scenario_questions(scenario_name) if "id" in q}
+            done = set(job["done_ids"])
+            pending = [qid for qid in job["question_ids"] if qid not in done]
+            if pending:
+                # Retried now; failures of questions without an id stay
+                await self.jobs.update_one({"job_id": job_id}, {"$unset": {f"failed.{qid}": "" for qid in pending}})
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def paraphrase(qid: str):
+                async with semaphore:
+                    if qid not in questions:
+                        return qid, None, "Question no longer in scenario"
+                    try:
+                        return qid, await self._paraphrase(model, context, difficulty, questions[qid]), None
+                    except Exception as e:
+                        return qid, None, str(e)
+
+            for start in range(0, len(pending), self.batch_size):
+                results = await asyncio.gather(*(paraphrase(qid) for qid in pending[start:start + self.batch_size]))
+                await self._save_batch(job_id, scenario_name, difficulty, results)
+
+            failed = (await self.jobs.find_one({"job_id": job_id}, {"failed": 1})).get("failed") or {}
+            await self.jobs.update_one(
+                {"job_id": job_id},
+                {"$set": {"status": "partial" if failed else "done", "finished_at": datetime.now(),
+                          "updated_at": datetime.now()}}
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error in paraphrase job {job_id}: {e}")
+            await self.jobs.update_one(
+                {"job_id": job_id},
+                {"$set": {"status": "failed", "error": str(e), "updated_at": datetime.now()}}
+            )
+
+    async def _save_batch(self, job_id: str, scenario_name: str, difficulty: str, results: List):
+        now = datetime.now()
+        operations = [
+            UpdateOne(
+                {"original_question_id": qid, "scenario_name": scenario_name, "difficulty": difficulty},
+                {
+                    "$set": {"paraphrased_data": data, "is_active": True, "created_at": now},
+                    "$setOnInsert": {"id": str(uuid.uuid4())}
+                },
+                upsert=True
+            )
+            for qid, data, error in results if data is not None
+        ]
+        if operations:
+            await self.db.paraphrased_questions.bulk_write(operations, ordered=False)
+            paraphrase_cache.invalidate(scenario_name, difficulty)
+
+        update = {"$set": {"updated_at": datetime.now()}}
+        done_ids = [qid for qid, data, error in results if data is not None]
+        if done_ids:
+            update["$addToSet"] = {"done_ids": {"$each": done_ids}}
+        for qid, data, error in results:
+            if error is not None:
+                update["$set"][f"failed.{qid}"] = error
+        await self.jobs.update_one({"job_id": job_id}, update)
@@ -0,0 +1,98 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv(".env")
+
+
+class FormattedHistoryCache:
+    """
+    Formatted message dicts per session, so each turn only formats what is new.
+
+    history may be the tail of a session (a SessionView) starting at message
+    offset. Histories only grow, so the cached messages are reused when they
+    overlap the requested range and the last cached message is unchanged;
+    otherwise the range is formatted from scratch. Kept per bot, because the
+    role mapping depends on the bot's configuration.
+    """
+
+    def __init__(self, max_sessions: int = 1000):
+        self.max_sessions = max_sessions
+        # session_id -> (offset of the first cached message, formatted messages, content of the last one)
+        self.entries: "OrderedDict[str, Tuple[int, List[Dict[str, str]], str]]" = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "formatted_messages": 0}
+
+    def get(self, session_id: Optional[str], history: List, format_message: Callable,
+            offset: int = 0) -> List[Dict[str, str]]:
+        if not session_id or self.max_sessions <= 0:
+            self.counters["formatted_messages"] += len(history)
+            return [format_message(message) for message in history]
+
+        formatted: List[Dict[str, str]] = []
+        entry = self.entries.get(session_id)
+        if entry:
+            cached_offset, cached, last_content = entry
+            cached_end = cached_offset + len(cached)
+            # Reusable: starts at or before the request and ends inside it with the same last message
+            if cached_offset <= offset < cached_end <= offset + len(history) \
+                    and history[cached_end - 1 - offset].content == last_content:
+                formatted = cached[offset - cached_offset:]
+                self.counters["hits"] += 1
+            else:
+                self.counters["misses"] += 1
+        else:
+            self.counters["misses"] += 1
+
+        new = history[len(formatted):]
+        formatted.extend(format_message(message) for message in new)
+        self.counters["formatted_messages"] += len(new)
+
+        self.entries[session_id] = (offset, formatted, history[-1].content if history else "")
+        self.entries.move_to_end(session_id)
+        while len(self.entries) > self.max_sessions:
+            self.entries.popitem(last=False)
+        # Callers extend the list they get; keep the cached one separate
+        return list(formatted)
+
+
+class PromptCacheStats:
+    """
+    Azure OpenAI prompt caching per bot, from usage.prompt_tokens_details.cached_tokens.
+
+    Caching only applies to prompts of 1024+ tokens whose start is identical
+    to a recent request, which is why the system prompt is kept as a fixed
+    prefix ahead of everything that changes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bots: Dict[str, Dict[str, int]] = {}
+
+    def record(self, bot_name: str, prompt_tokens: int, cached_tokens: int):
+        with self.lock:
+            stats = self.bots.setdefault(bot_name, {"requests": 0, "cache_hits": 0, "prompt_tokens": 0, "cached_tokens": 0})
+            stats["requests"] += 1
+            stats["prompt_tokens"] += prompt_tokens or 0
+            stats["cached_tokens"] += cached_tokens or 0
+            if cached_tokens:
+                stats["cache_hits"] += 1
+
+    def stats(self) -> Dict:
+        with self.lock:
+            bots = {}
+            for name, stats in self.bots.items():
+                bots[name] = {
+                    **stats,
+                    "hit_ratio": stats["cache_hits"] / stats["requests"] if stats["requests"] else 0,
+                    "cached_token_ratio": stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0
+                }
+            return bots
+
+
+prompt_cache_stats = PromptCacheStats()
+
+# Sessions whose formatted history each bot keeps (0 = format every turn)
+FORMATTED_HISTORY_SESSIONS = int(os.getenv("FORMATTED_HISTORY_SESSIONS", "1000"))
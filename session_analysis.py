@@ -0,0 +1,73 @@
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from admission import INTERACTIVE
+from models import ChatReport
+from mongo import MongoDB
+
+
+class SessionAnalysisService:
+    """
+    Produces the ChatReport of a chat session at most once per conversation state.
+
+    A stored report carries the number of messages it was computed from; when
+    the session has grown since, the report is stale and is recomputed.
+    Concurrent requests for the same session and message count share one
+    in-flight analysis (single flight), and the unique index on
+    analysis.session_id plus an upsert keep one report per session across
+    workers.
+    """
+
+    def __init__(self, db: MongoDB, bot_factory, session_cache=None):
+        self.db = db
+        self.bot_factory = bot_factory
+        self.session_cache = session_cache
+        self.in_flight: Dict[Tuple[str, int], asyncio.Task] = {}
+        self.counters = {"cached": 0, "computed": 0, "joined": 0, "stale": 0}
+
+    async def get_analysis(self, session_id: str, priority: int = INTERACTIVE) -> Optional[ChatReport]:
+        """The current report for the session, or None when the session does not exist"""
+        if self.session_cache is not None:
+            # Buffered messages must be in Mongo before the raw read
+            await self.session_cache.flush(session_id)
+        session = await self.db.get_session_raw(session_id)
+        if not session:
+            return None
+
+        message_count = len(session.get("conversation_history") or [])
+        report = await self.db.get_session_analysis(session_id)
+        if report is not None:
+            # Reports stored before message_count was recorded are kept as they are
+            if report.message_count is None or report.message_count == message_count:
+                self.counters["cached"] += 1
+                return report
+            self.counters["stale"] += 1
+
+        key = (session_id, message_count)
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._analyse(session, message_count, priority))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+            self.counters["computed"] += 1
+        else:
+            self.counters["joined"] += 1
+        # shield: one caller disconnecting must not cancel the analysis for the others
+        return await asyncio.shield(task)
+
+    async def _analyse(self, session: dict, message_count: int, priority: int) -> ChatReport:
+        conversation = {"conversation_history": session["conversation_history"]}
+        analyzer = await self.bot_factory.get_bot_analyser(session["scenario_name"])
+        results = await analyzer.analyze_conversation(conversation, priority)
+        results["session_id"] = session["session_id"]
+        results["conversation_id"] = str(uuid.uuid4())
+        results["timestamp"] = datetime.now()
+        results["message_count"] = message_count
+        report = ChatReport(**results)
+        await self.db.save_session_analysis(report)
+        return report
+
+    def stats(self) -> Dict:
+        return {**self.counters, "in_flight": len(self.in_flight)}
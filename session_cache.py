@@ -0,0 +1,244 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from models import Message, ChatSession, SessionView
+from mongo import MongoDB
+
+
+class SessionCache:
+    """
+    In-process LRU/TTL cache in front of MongoDB chat sessions.
+
+    The POST /gt/api/chat then GET /gt/api/chat/stream pattern reads the same
+    session twice in a row; with the cache only the first read goes to Mongo
+    and validates the history. Appended messages are applied to the cached
+    copy and written straight through. With flush_interval > 0 they are
+    instead buffered and written together with a single $push on the next
+    flush (write-behind), except appends made with write_through=True, which
+    a request on another worker may read right away. A flush of a session
+    waits for any write of it already in progress, so reads that flush first
+    always see every message appended before them.
+
+    Another worker may have appended to a cached session, so with validate
+    on (the default) a hit first reads the stored history length and
+    summary position ($size, no messages) and reloads the session when they
+    differ from the cached copy. Write-behind assumes a session is served by
+    one worker at a time (sticky routing or a single worker); keep
+    SESSION_CACHE_FLUSH_INTERVAL=0 otherwise. Only such deployments can turn
+    validation off (SESSION_CACHE_VALIDATE=0). Set SESSION_CACHE_SIZE=0 to
+    disable the cache.
+    """
+
+    def __init__(self, db: MongoDB, max_size: int = 1000, ttl: float = 300.0, flush_interval: float = 0.0,
+                 validate: bool = True):
+        self.db = db
+        self.max_size = max_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.validate = validate
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()  # session_id -> (session, loaded_at)
+        self.pending: Dict[str, List[Message]] = {}
+        self.flushing: Dict[str, asyncio.Future] = {}  # session_id -> resolved when its write finishes
+        self.flush_task: Optional[asyncio.Task] = None
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "view_reads": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "stale": 0,
+            "flushes": 0,
+            "flushed_messages": 0,
+            "flush_errors": 0
+        }
+
+    @classmethod
+    def from_env(cls, db: MongoDB) -> "SessionCache":
+        return cls(
+            db,
+            max_size=int(os.getenv("SESSION_CACHE_SIZE", "1000")),
+            ttl=float(os.getenv("SESSION_CACHE_TTL", "300")),
+            flush_interval=float(os.getenv("SESSION_CACHE_FLUSH_INTERVAL", "0")),
+            validate=os.getenv("SESSION_CACHE_VALIDATE", "1") == "1"
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def _copy(session: ChatSession) -> ChatSession:
+        # Callers append to the history they get back; keep the cached list separate
+        # Shallow model_copy: no validation, messages are shared (they are never mutated)
+        return session.model_copy(update={"conversation_history": list(session.conversation_history)})
+
+    async def _cached(self, session_id: str) -> Optional[ChatSession]:
+        """The cached session if it is still current; drops it otherwise"""
+        entry = self.entries.get(session_id) if self.enabled else None
+        if not entry:
+            return None
+        session, loaded_at = entry
+        if time.monotonic() - loaded_at > self.ttl:
+            self.counters["expirations"] += 1
+            await self._drop(session_id)
+            return None
+        if self.validate:
+            stored = await self.db.get_session_view(session_id, last_n=0)
+            # Messages still buffered here are in the cached copy but not stored yet
+            expected = len(session.conversation_history) - len(self.pending.get(session_id, []))
+            if stored is None or stored.message_count != expected \
+                    or (stored.summary_upto or 0) != (session.summary_upto or 0):
+                self.counters["stale"] += 1
+                await self._drop(session_id)
+                return None
+        self.entries.move_to_end(session_id)
+        self.counters["hits"] += 1
+        return session
+
+    async def get_session(self, session_id: str) -> Optional[ChatSession]:
+        if not self.enabled:
+            return await self.db.get_session(session_id)
+
+        session = await self._cached(session_id)
+        if session:
+            return self._copy(session)
+
+        self.counters["misses"] += 1
+        await self.flush(session_id)
+        session = await self.db.get_session(session_id)
+        if session:
+            await self._store(session)
+            return self._copy(session)
+        return None
+
+    async def get_session_view(self, session_id: str, last_n: Optional[int] = None) -> Optional[SessionView]:
+        """
+        The last last_n messages plus metadata (None = all, 0 = none).
+
+        Served from the cached session when it is cached; otherwise read with
+        a $slice projection, which is not cached because it is partial.
+        """
+        # Validating costs the same read as a view of no messages; skip the cache for those
+        session = await self._cached(session_id) if last_n != 0 or not self.validate else None
+        if session:
+            history = session.conversation_history
+            window = list(history if last_n is None else history[-last_n:] if last_n else [])
+            return SessionView.model_construct(
+                session_id=session.session_id,
+                scenario_name=session.scenario_name,
+                conversation_history=window,
+                history_offset=len(history) - len(window),
+                message_count=len(history),
+                summary=session.summary,
+                summary_upto=session.summary_upto
+            )
+
+        self.counters["view_reads"] += 1
+        await self.flush(session_id)
+        return await self.db.get_session_view(session_id, last_n)
+
+    async def get_messages(self, session_id: str, start: int, count: int) -> List[Message]:
+        await self.flush(session_id)
+        return await self.db.get_messages(session_id, start, count)
+
+    async def create_session(self, session: ChatSession) -> str:
+        """Insert a new session (always written through) and cache it"""
+        session_id = await self.db.create_session(session)
+        if self.enabled:
+            await self._store(self._copy(session))
+        return session_id
+
+    async def append_messages(self, session_id: str, messages: List[Message], write_through: bool = False):
+        entry = self.entries.get(session_id) if self.enabled else None
+        if entry:
+            session, _ = entry
+            session.conversation_history.extend(messages)
+            session.last_updated = datetime.now()
+
+        if self.enabled and self.flush_interval > 0:
+            self.pending.setdefault(session_id, []).extend(messages)
+            if write_through:
+                # Behind anything still buffered for the session, so the order is kept
+                await self.flush(session_id)
+        else:
+            await self.db.append_messages(session_id, messages)
+
+    async def set_summary(self, session_id: str, summary: str, summary_upto: int):
+        """Store a rolling summary (written through) and apply it to the cached copy"""
+        if not await self.db.set_session_summary(session_id, summary, summary_upto):
+            return
+        entry = self.entries.get(session_id) if self.enabled else None
+        if entry:
+            session, _ = entry
+            session.summary = summary
+            session.summary_upto = summary_upto
+
+    async def flush(self, session_id: Optional[str] = None):
+        """Write buffered messages for one session, or for all sessions"""
+        session_ids = [session_id] if session_id else list(self.pending)
+        for sid in session_ids:
+            await self._flush_session(sid)
+
+    async def _flush_session(self, sid: str):
+        # A write in progress has already taken its messages out of pending; wait for it
+        while sid in self.flushing:
+            await asyncio.shield(self.flushing[sid])
+        messages = self.pending.pop(sid, None)
+        if not messages:
+            return
+        done = asyncio.get_running_loop().create_future()
+        self.flushing[sid] = done
+        try:
+            await self.db.append_messages(sid, messages)
+            self.counters["flushes"] += 1
+            self.counters["flushed_messages"] += len(messages)
+        except Exception as e:
+            print(f"Error flushing session {sid}: {e}")
+            self.counters["flush_errors"] += 1
+            # Put them back ahead of anything appended meanwhile
+            self.pending[sid] = messages + self.pending.get(sid, [])
+        finally:
+            del self.flushing[sid]
+            done.set_result(None)
+
+    async def _store(self, session: ChatSession):
+        self.entries[session.session_id] = (session, time.monotonic())
+        self.entries.move_to_end(session.session_id)
+        while len(self.entries) > self.max_size:
+            oldest = next(iter(self.entries))
+            self.counters["evictions"] += 1
+            await self._drop(oldest)
+
+    async def _drop(self, session_id: str):
+        self.entries.pop(session_id, None)
+        await self.flush(session_id)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self.enabled and self.flush_interval > 0 and not self.flush_task:
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_ratio": self.counters["hits"] / lookups if lookups else 0,
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "pending_sessions": len(self.pending),
+            "pending_messages": sum(len(m) for m in self.pending.values())
+        }
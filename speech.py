@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException,UploadFile,Form,File,Response, status, Body, Path, Query
+from fastapi import APIRouter, Depends, HTTPException,UploadFile,Form,File,Response, status, Body, Path, Query, Request, WebSocket, WebSocketDisconnect
 import azure.cognitiveservices.speech as speechsdk
 import tempfile
 import os
 import time
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import aiofiles
 import asyncio
 from dotenv import load_dotenv
@@ -12,6 +12,12 @@ import aiohttp
 import json
 import uuid
 import base64
+import re
+from tts_cache import AudioCache, cache_key
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 load_dotenv(".env")
 import datetime
@@ -24,85 +30,599 @@ class SpeechRecognitionResponse(BaseModel):
     status: str
     
 
-speech_config = speechsdk.SpeechConfig(  
-        subscription=subscription,  
-        region="centralindia",  
-    )
-speech_config_ = speechsdk.SpeechConfig(  
-        subscription=subscription,  
-        region="centralindia",  
-    )    
+recognition_configs = {}
+recognition_configs_lock = threading.Lock()
+
+
+def recognition_config(language: str) -> speechsdk.SpeechConfig:
+    """
+    Recognition config for one language, built once and never mutated.
+
+    SpeechRecognizers are bound to their audio input when created, so they
+    cannot be pooled across requests; the per-language config is what gets
+    reused, and concurrent requests in different languages no longer share
+    (and overwrite) one config.
+    """
+    with recognition_configs_lock:
+        config = recognition_configs.get(language)
+        if config is None:
+            config = speechsdk.SpeechConfig(subscription=subscription, region="centralindia")
+            config.set_profanity(speechsdk.ProfanityOption.Raw)
+            config.speech_recognition_language = language
+            recognition_configs[language] = config
+        return config
+
+
+class RecognitionStats:
+    """Per-language STT timing: queue wait, recognition time and audio throughput"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.languages = {}
+
+    def record(self, language: str, queue_wait: float, recognition_time: float, audio_seconds: float, failed: bool = False):
+        with self.lock:
+            entry = self.languages.setdefault(language, {
+                "requests": 0,
+                "failed": 0,
+                "queue_wait": 0.0,
+                "recognition_time": 0.0,
+                "audio_seconds": 0.0
+            })
+            entry["requests"] += 1
+            entry["failed"] += int(failed)
+            entry["queue_wait"] += queue_wait
+            entry["recognition_time"] += recognition_time
+            entry["audio_seconds"] += audio_seconds
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                language: {
+                    "requests": entry["requests"],
+                    "failed": entry["failed"],
+                    "avg_queue_wait": entry["queue_wait"] / entry["requests"],
+                    "avg_recognition_time": entry["recognition_time"] / entry["requests"],
+                    "audio_seconds": entry["audio_seconds"],
+                    # Above 1.0 means audio is recognized faster than real time
+                    "audio_seconds_per_wall_second": entry["audio_seconds"] / entry["recognition_time"] if entry["recognition_time"] else 0
+                }
+                for language, entry in self.languages.items()
+            }
+
+
+recognition_stats = RecognitionStats()
+
+
+def synthesis_config(voice_id: str, text_stream: bool = False) -> speechsdk.SpeechConfig:
+    """Fresh synthesis config for one voice; never shared or mutated after creation"""
+    if text_stream:
+        # TextStream input is only accepted on the v2 websocket endpoint
+        config = speechsdk.SpeechConfig(
+            endpoint="wss://centralindia.tts.speech.microsoft.com/cognitiveservices/websocket/v2",
+            subscription=subscription
+        )
+    else:
+        config = speechsdk.SpeechConfig(subscription=subscription, region="centralindia")
+    config.speech_synthesis_voice_name = voice_id
+    return config
+
+
+class SynthesizerPool:
+    """
+    Warm, reusable SpeechSynthesizers keyed by voice.
+
+    Building a synthesizer and opening its connection is paid once per pooled
+    instance instead of once per request. Each synthesizer is bound to its own
+    config, so concurrent requests with different voices cannot affect each
+    other. Threads check a synthesizer out, use it exclusively and return it;
+    instances idle for longer than idle_timeout are closed.
+    """
+
+    def __init__(self, max_idle_per_voice: int = 4, idle_timeout: float = 300.0):
+        self.max_idle_per_voice = max_idle_per_voice
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.idle = {}  # (voice_id, text_stream) -> deque of (synthesizer, connection, returned_at)
+        self.counters = {"created": 0, "reused": 0, "evicted": 0, "discarded": 0}
+
+    def _create(self, voice_id: str, text_stream: bool):
+        synthesizer = speechsdk.SpeechSynthesizer(
+            speech_config=synthesis_config(voice_id, text_stream),
+            audio_config=None
+        )
+        # Open the service connection now rather than on the first request
+        connection = speechsdk.Connection.from_speech_synthesizer(synthesizer)
+        connection.open(True)
+        with self.lock:
+            self.counters["created"] += 1
+        return synthesizer, connection
+
+    def _evict_idle(self):
+        """Drop synthesizers idle for too long; caller holds the lock"""
+        now = time.monotonic()
+        for key, entries in self.idle.items():
+            while entries and now - entries[0][2] > self.idle_timeout:
+                _, connection, _ = entries.popleft()
+                self.counters["evicted"] += 1
+                try:
+                    connection.close()
+                except Exception as e:
+                    print(f"Error closing synthesizer connection: {e}")
+
+    def checkout(self, voice_id: str, text_stream: bool = False):
+        key = (voice_id, text_stream)
+        with self.lock:
+            self._evict_idle()
+            entries = self.idle.get(key)
+            if entries:
+                synthesizer, connection, _ = entries.pop()
+                self.counters["reused"] += 1
+                return synthesizer, connection
+        return self._create(voice_id, text_stream)
+
+    def checkin(self, voice_id: str, synthesizer, connection, text_stream: bool = False, healthy: bool = True):
+        key = (voice_id, text_stream)
+        with self.lock:
+            entries = self.idle.setdefault(key, deque())
+            if healthy and len(entries) < self.max_idle_per_voice:
+                entries.append((synthesizer, connection, time.monotonic()))
+                return
+            self.counters["discarded"] += 1
+        try:
+            connection.close()
+        except Exception as e:
+            print(f"Error closing synthesizer connection: {e}")
+
+    @contextmanager
+    def synthesizer(self, voice_id: str, text_stream: bool = False):
+        """Exclusive use of a pooled synthesizer; it is discarded if the block raises"""
+        synthesizer, connection = self.checkout(voice_id, text_stream)
+        healthy = False
+        try:
+            yield synthesizer
+            healthy = True
+        finally:
+            self.checkin(voice_id, synthesizer, connection, text_stream, healthy)
+
+    def warm(self, voice_ids: List[str], per_voice: int):
+        for voice_id in voice_ids:
+            for _ in range(per_voice):
+                try:
+                    synthesizer, connection = self._create(voice_id, False)
+                    self.checkin(voice_id, synthesizer, connection)
+                except Exception as e:
+                    print(f"Error warming synthesizer for {voice_id}: {e}")
+
+    def stats(self) -> dict:
+        with self.lock:
+            self._evict_idle()
+            return {
+                **self.counters,
+                "idle": {f"{voice}{' (stream)' if stream else ''}": len(entries) for (voice, stream), entries in self.idle.items()}
+            }
+
+
+synthesizer_pool = SynthesizerPool(
+    max_idle_per_voice=int(os.getenv("TTS_POOL_MAX_IDLE", os.getenv("TTS_MAX_CONCURRENCY", "4"))),
+    idle_timeout=float(os.getenv("TTS_POOL_IDLE_TIMEOUT", "300"))
+)
+
+
+def synthesize_text(message: str, voice_id: str) -> bytes:
+    """Blocking synthesis on a pooled synthesizer; runs on the TTS executor"""
+    with synthesizer_pool.synthesizer(voice_id) as synthesizer:
+        result = synthesizer.speak_text_async(message).get()
+        if result.reason == speechsdk.ResultReason.Canceled:
+            # Do not put a synthesizer with a failed connection back in the pool
+            raise RuntimeError(f"Speech synthesis canceled: {result.cancellation_details.error_details}")
+        if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+            return result.audio_data
+        return b""
+
+
+audio_cache = AudioCache.from_env()
+
+
+def cached_synthesis(message: str, voice_id: str, synthesize) -> bytes:
+    """Serve from the audio cache (memory or disk) or synthesize and store; blocking"""
+    audio = audio_cache.get(voice_id, message)
+    if audio is None:
+        audio = synthesize(message, voice_id)
+        audio_cache.put(voice_id, message, audio)
+    return audio
+
+
+# cache key -> future of the synthesis in progress for it (None when it failed)
+synthesis_in_flight: Dict[str, asyncio.Future] = {}
+
+
+async def synthesize_audio(message: str, voice_id: str, text_stream: bool = False) -> bytes:
+    """
+    Audio for one piece of text, from the cache when possible.
+
+    Memory hits return without taking a TTS executor slot; disk hits and
+    synthesis run on the executor. Concurrent misses on the same text and
+    voice share one executor job: the others wait on the event loop, holding
+    no thread, and try themselves if it fails.
+    """
+    while True:
+        audio = audio_cache.get_memory(voice_id, message)
+        if audio is not None:
+            return audio
+        key = cache_key(voice_id, message)
+        flight = synthesis_in_flight.get(key)
+        if flight is None:
+            break
+        audio = await asyncio.shield(flight)
+        if audio is not None:
+            return audio
+
+    flight = asyncio.get_running_loop().create_future()
+    synthesis_in_flight[key] = flight
+    audio = None
+    try:
+        synthesize = synthesize_text_stream if text_stream else synthesize_text
+        audio = await tts_executor.run(cached_synthesis, message, voice_id, synthesize)
+        return audio
+    finally:
+        del synthesis_in_flight[key]
+        flight.set_result(audio)
+
+
+@router.on_event("startup")
+async def warm_synthesizers():
+    """Pre-connect synthesizers for the voices we expect to use"""
+    voices = [v.strip() for v in os.getenv("TTS_WARM_VOICES", "ar-SA-HamedNeural").split(",") if v.strip()]
+    per_voice = int(os.getenv("TTS_POOL_WARM_SIZE", "2"))
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, synthesizer_pool.warm, voices, per_voice)
+
+
+
+class SpeechExecutor:
+    """
+    Bounded thread pool for blocking Speech SDK calls.
+
+    Keeps synthesis/recognition off the event loop and caps how many run at
+    once, so speech load cannot starve the chat streams. Jobs beyond
+    max_queue waiting jobs are rejected with 503, and every job has a timeout.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, timeout: float):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"speech-{name}")
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.counters = {"completed": 0, "failed": 0, "timeouts": 0, "rejected": 0}
+        self.total_wait = 0.0
+        self.total_run = 0.0
+
+    async def run(self, fn, *args, timeout: Optional[float] = None):
+        with self.lock:
+            if self.queued >= self.max_queue:
+                self.counters["rejected"] += 1
+                raise HTTPException(status_code=503, detail=f"Speech {self.name} service is busy", headers={"Retry-After": "1"})
+            self.queued += 1
+        submitted = time.monotonic()
+        state = {"started": False, "cancelled": False}
+
+        def job():
+            with self.lock:
+                if state["cancelled"]:
+                    return None
+                state["started"] = True
+                self.queued -= 1
+                self.active += 1
+                self.total_wait += time.monotonic() - submitted
+            started = time.monotonic()
+            try:
+                result = fn(*args)
+                with self.lock:
+                    self.counters["completed"] += 1
+                return result
+            except Exception:
+                with self.lock:
+                    self.counters["failed"] += 1
+                raise
+            finally:
+                with self.lock:
+                    self.active -= 1
+                    self.total_run += time.monotonic() - started
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(self.executor, job), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            with self.lock:
+                self.counters["timeouts"] += 1
+                state["cancelled"] = True
+                if not state["started"]:
+                    self.queued -= 1
+            raise
+
+    def stats(self) -> dict:
+        with self.lock:
+            finished = self.counters["completed"] + self.counters["failed"]
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "timeout": self.timeout,
+                "queued": self.queued,
+                "active": self.active,
+                **self.counters,
+                "avg_queue_wait": self.total_wait / finished if finished else 0,
+                "avg_run_time": self.total_run / finished if finished else 0
+            }
+
+
+tts_executor = SpeechExecutor(
+    "tts",
+    max_workers=int(os.getenv("TTS_MAX_CONCURRENCY", "4")),
+    max_queue=int(os.getenv("TTS_MAX_QUEUE", "32")),
+    timeout=float(os.getenv("TTS_TIMEOUT", "30"))
+)
+stt_executor = SpeechExecutor(
+    "stt",
+    max_workers=int(os.getenv("STT_MAX_CONCURRENCY", "4")),
+    max_queue=int(os.getenv("STT_MAX_QUEUE", "16")),
+    timeout=float(os.getenv("STT_TIMEOUT", "120"))
+)
+
+STT_CHUNK_SIZE = 32 * 1024
+# Bytes collected before reading the WAV header; covers headers with extra chunks
+WAV_HEADER_PROBE = 4096
+
+
 @router.post("/stt", response_model=SpeechRecognitionResponse)  
 async def speech_recognition_endpoint(file: UploadFile = File(...), language_code: str = Form(...)):  
     """  
     FastAPI endpoint that accepts an audio file via POST request and  
     performs continuous speech recognition using Azure Speech SDK.  
+    The upload is fed to the recognizer chunk by chunk, without a temp file.
     """ 
     print(file) 
     # Check file type (optional)  
     if not file.content_type.startswith("audio/"):  
         raise HTTPException(status_code=400, detail="File must be an audio file")  
+
+    async def upload_chunks():
+        while True:
+            chunk = await file.read(STT_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    try:
+        recognized_text = await recognize_chunks(upload_chunks(), language_code)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Speech recognition timed out")
   
-    # Unfortunately, the Speech SDK requires a file on disk  
-    # We need to temporarily save the file  
-    async with aiofiles.tempfile.NamedTemporaryFile(delete=False) as temp_file:  
-        temp_file_name = temp_file.name  
-  
-    try:  
-        # Write uploaded file content to temporary file  
-        async with aiofiles.open(temp_file_name, "wb") as buffer:  
-            content = await file.read()  
-            await buffer.write(content)  
-  
-        # Call the continuous speech recognition function  
-        recognized_text = await stt(temp_file_name, language_code)  
-  
-        return SpeechRecognitionResponse(  
-            text=recognized_text,  
-            status="success"  
-        )  
-    finally:  
-        # Clean up the temporary file  
-        if os.path.exists(temp_file_name):  
-            os.unlink(temp_file_name)  
-  
+    return SpeechRecognitionResponse(  
+        text=recognized_text,  
+        status="success"  
+    )  
+
+
+@router.post("/stt/stream", response_model=SpeechRecognitionResponse)
+async def speech_recognition_stream_endpoint(request: Request, language_code: str = Query(...)):
+    """
+    Speech recognition on a raw audio request body (WAV or 16 kHz 16-bit mono PCM).
+
+    Recognition starts with the first received bytes and runs while the rest
+    of the body is still uploading.
+    """
+    try:
+        recognized_text = await recognize_chunks(request.stream(), language_code)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Speech recognition timed out")
+    return SpeechRecognitionResponse(text=recognized_text, status="success")
+
+
+@router.websocket("/stt/ws")
+async def speech_recognition_websocket(websocket: WebSocket, language_code: str = Query(...)):
+    """
+    Live speech recognition over a WebSocket.
+
+    The client sends audio as binary frames and the text frame "end" when it
+    is done. The server sends {"type": "recognizing"} partial hypotheses and
+    {"type": "recognized"} phrases as they happen, then {"type": "final"}
+    with the whole text.
+    """
+    await websocket.accept()
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def on_event(kind, text):
+        # Called on Speech SDK threads
+        loop.call_soon_threadsafe(events.put_nowait, {"type": kind, "text": text})
+
+    async def audio_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                yield message["bytes"]
+            elif message.get("text") == "end":
+                return
+
+    async def forward_events():
+        while True:
+            event = await events.get()
+            if event is None:
+                return
+            await websocket.send_json(event)
+
+    forwarder = asyncio.create_task(forward_events())
+    try:
+        text = await recognize_chunks(audio_frames(), language_code, on_event)
+        events.put_nowait(None)
+        await forwarder
+        await websocket.send_json({"type": "final", "text": text, "status": "success"})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except (asyncio.TimeoutError, HTTPException) as e:
+        detail = "Speech recognition timed out" if isinstance(e, asyncio.TimeoutError) else e.detail
+        await websocket.send_json({"type": "error", "detail": detail})
+        await websocket.close()
+    finally:
+        forwarder.cancel()
+
+
+def parse_wav_header(data: bytes):
+    """
+    Audio format and offset of the sample data in a WAV header.
+
+    Returns (None, 0) when the data is not a RIFF/WAVE header, in which case
+    it is treated as raw 16 kHz 16-bit mono PCM (the SDK default).
+    """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None, 0
+    position = 12
+    stream_format = None
+    while position + 8 <= len(data):
+        chunk_id = data[position:position + 4]
+        chunk_size = int.from_bytes(data[position + 4:position + 8], "little")
+        body = position + 8
+        if chunk_id == b"fmt " and body + 16 <= len(data):
+            channels = int.from_bytes(data[body + 2:body + 4], "little")
+            sample_rate = int.from_bytes(data[body + 4:body + 8], "little")
+            bits_per_sample = int.from_bytes(data[body + 14:body + 16], "little")
+            stream_format = speechsdk.audio.AudioStreamFormat(
+                samples_per_second=sample_rate,
+                bits_per_sample=bits_per_sample,
+                channels=channels
+            )
+        elif chunk_id == b"data":
+            return stream_format, body
+        position = body + chunk_size + (chunk_size % 2)
+    return None, 0
+
+
+async def recognize_chunks(chunks, language, on_event=None) -> str:
+    """
+    Recognize audio arriving as an async iterator of byte chunks.
+
+    Chunks are written to a PushAudioInputStream as they arrive while the
+    recognizer runs on the STT executor, so recognition overlaps the upload
+    and the audio is never held in full.
+    """
+    header = b""
+    iterator = chunks.__aiter__()
+    async for chunk in iterator:
+        header += chunk
+        if len(header) >= WAV_HEADER_PROBE:
+            break
+
+    stream_format, data_offset = parse_wav_header(header)
+    if stream_format:
+        push_stream = speechsdk.audio.PushAudioInputStream(stream_format=stream_format)
+    else:
+        push_stream = speechsdk.audio.PushAudioInputStream()
+
+    recognition = asyncio.ensure_future(
+        stt_executor.run(recognize_stream, push_stream, language, on_event, time.monotonic())
+    )
+    try:
+        push_stream.write(header[data_offset:])
+        async for chunk in iterator:
+            if recognition.done():
+                # Rejected, timed out or failed; stop reading the upload
+                break
+            push_stream.write(chunk)
+    finally:
+        push_stream.close()
+
+    text = await recognition
+    print("YOU: ", text)
+    return text
+
+
 async def stt(filename, language):  
     """  
     Continuous speech recognition function that processes an audio file  
     and returns the recognized text.  
     """  
-    result_text = []  
-  
+    text = await stt_executor.run(recognize_file, filename, language, time.monotonic())
+    print("YOU: ", text)  
+    return text 
 
-    speech_config.set_profanity(speechsdk.ProfanityOption.Raw)
-    speech_config.speech_recognition_language = language 
-  
+
+def recognize_file(filename, language, submitted=None):
+    """Blocking continuous recognition of one file; runs on the STT executor"""
     audio_config = speechsdk.audio.AudioConfig(filename=filename)  
-    speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)  
+    return recognize_audio(audio_config, language, submitted=submitted)
+
+
+def recognize_stream(push_stream, language, on_event=None, submitted=None):
+    """Blocking continuous recognition of a push stream; runs on the STT executor"""
+    audio_config = speechsdk.audio.AudioConfig(stream=push_stream)
+    return recognize_audio(audio_config, language, on_event, submitted)
+
+
+def recognize_audio(audio_config, language, on_event=None, submitted=None):
+    """
+    Blocking continuous recognition until the audio ends.
+
+    on_event(kind, text) is called from SDK threads with "recognizing"
+    partial hypotheses and "recognized" phrases. submitted is the monotonic
+    time the job was queued, for the per-language queue wait metric.
+    """
+    started = time.monotonic()
+    result_text = []
+    # End of the last recognized phrase, in 100 ns ticks
+    audio_end = [0]
+    failed = [False]
   
-    done = asyncio.Event()  
+    speech_recognizer = speechsdk.SpeechRecognizer(speech_config=recognition_config(language), audio_config=audio_config)  
+  
+    done = threading.Event()
   
     def stop_cb(evt: speechsdk.SessionEventArgs):  
         """callback that signals to stop continuous recognition upon receiving an event `evt`"""  
         done.set()  
-  
+
+    def canceled_cb(evt):
+        if evt.cancellation_details.reason == speechsdk.CancellationReason.Error:
+            failed[0] = True
+            print(f"STT canceled: {evt.cancellation_details.error_details}")
+        done.set()
+
+    def recognized_cb(evt):
+        audio_end[0] = max(audio_end[0], evt.result.offset + evt.result.duration)
+        if evt.result.text:
+            result_text.append(evt.result.text)
+            if on_event:
+                on_event("recognized", evt.result.text)
+
     # Connect callbacks to the events fired by the speech recognizer  
-    speech_recognizer.recognized.connect(lambda evt: result_text.append(evt.result.text))  
+    speech_recognizer.recognized.connect(recognized_cb)
+    if on_event:
+        speech_recognizer.recognizing.connect(lambda evt: on_event("recognizing", evt.result.text))
     # Stop continuous recognition on either session stopped or canceled events  
     speech_recognizer.session_stopped.connect(stop_cb)  
-    speech_recognizer.canceled.connect(stop_cb)  
-  
-    # Start continuous speech recognition  
-    speech_recognizer.start_continuous_recognition_async()  
+    speech_recognizer.canceled.connect(canceled_cb)
   
-    # Wait until recognition is done  
-    await done.wait()  
-  
-    speech_recognizer.stop_continuous_recognition_async()  
+    # Start continuous speech recognition and wait until it is done
+    speech_recognizer.start_continuous_recognition()
+    done.wait(stt_executor.timeout)
+    speech_recognizer.stop_continuous_recognition()
+
+    recognition_stats.record(
+        language,
+        queue_wait=started - submitted if submitted else 0.0,
+        recognition_time=time.monotonic() - started,
+        audio_seconds=audio_end[0] / 10_000_000,
+        failed=failed[0]
+    )
   
-    text = " ".join(result_text)  
-    print("YOU: ", text)  
-    return text 
+    return " ".join(result_text)
 
 
 
@@ -112,18 +632,19 @@ async def text_to_speech(
     voice_id: str = Form(default="ar-SA-HamedNeural"),
 ):
 
-    speech_config_.speech_synthesis_voice_name = voice_id
     print(voice_id)
-    # Use default speaker output but capture the result
-    synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config_, audio_config=None)
     start=datetime.datetime.now()
     print(start)
-    result = synthesizer.speak_text_async(message).get()
+    try:
+        audio_data = await synthesize_audio(message, voice_id)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Speech synthesis timed out")
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
     print(datetime.datetime.now()-start)
-    print(result)
     # if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
     return Response(
-            content=result.audio_data,
+            content=audio_data,
             media_type="audio/wav",
             headers={"Content-Disposition": "attachment; filename=speech.wav"}
         )
@@ -149,6 +670,17 @@ async def test_streaming_tts(
     else:
         raise HTTPException(status_code=500, detail="Streaming TTS failed")
 
+@router.get("/metrics")
+async def speech_metrics():
+    """Speech executor queues and timing, synthesizer pool usage and audio cache hit rates"""
+    return {
+        "tts": tts_executor.stats(),
+        "stt": stt_executor.stats(),
+        "stt_languages": recognition_stats.stats(),
+        "synthesizer_pool": synthesizer_pool.stats(),
+        "audio_cache": audio_cache.stats()
+    }
+
 @router.get("/demo")
 async def tts_demo():
     """Frontend demo for testing streaming TTS"""
@@ -164,17 +696,13 @@ async def streaming_tts_demo():
     return Response(content=html, media_type="text/html")
 
 class StreamingTTSHandler:
-    def __init__(self, voice_id: str = "ar-SA-HamedNeural"):
-        # Setup like your example
-        self.speech_config = speechsdk.SpeechConfig(
-            subscription=subscription,
-            region="centralindia"
+    def __init__(self, voice_id: str = "ar-SA-HamedNeural", synthesizer=None):
+        # A pooled synthesizer can be passed in; otherwise build a TextStream one
+        # audio_config=None keeps the audio in memory instead of playing it on a speaker
+        self.synthesizer = synthesizer or speechsdk.SpeechSynthesizer(
+            speech_config=synthesis_config(voice_id, text_stream=True),
+            audio_config=None
         )
-        self.speech_config.speech_synthesis_voice_name = voice_id
-        # self.speech_config.set_property(speechsdk.PropertyId.SpeechSynthesis_FrameTimeoutInterval, "100000000")
-        # self.speech_config.set_property(speechsdk.PropertyId.SpeechSynthesis_RtfTimeoutThreshold, "10")
-        
-        self.synthesizer = speechsdk.SpeechSynthesizer(speech_config=self.speech_config)
         self.tts_request = None
         self.tts_task = None
         
@@ -206,27 +734,114 @@ class StreamingTTSHandler:
             print(f"TTS exception: {e}")
         return b""
 
+def synthesize_text_stream(text: str, voice_id: str = "ar-SA-HamedNeural") -> bytes:
+    """Synthesize one piece of text through the TextStream path (blocking)"""
+    with synthesizer_pool.synthesizer(voice_id, text_stream=True) as synthesizer:
+        handler = StreamingTTSHandler(voice_id, synthesizer)
+        handler.start_streaming()
+        handler.add_text(text)
+        audio_data = handler.finish_streaming()
+        if not audio_data:
+            raise RuntimeError("TextStream synthesis returned no audio")
+        return audio_data
+
+
+# Sentence end: terminal punctuation (Latin, Arabic, CJK) followed by whitespace, or a newline
+SENTENCE_END = re.compile(r'[.!?؟。！？…]+["\')\]»]*(?=\s)|\n+')
+PIPELINED_TTS_CONCURRENCY = int(os.getenv("PIPELINED_TTS_CONCURRENCY", "3"))
+
+
+class SentenceSplitter:
+    """Accumulates streamed text and hands back complete sentences"""
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self.buffer):
+            sentences.append(self.buffer[start:match.end()])
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return [s.strip() for s in sentences if s.strip()]
+
+    def flush(self) -> List[str]:
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return [rest] if rest else []
+
+
+class SentenceTTSPipeline:
+    """
+    Synthesizes a streamed reply sentence by sentence.
+
+    Text is fed as it arrives from the LLM; every complete sentence is sent
+    to TTS right away, with up to PIPELINED_TTS_CONCURRENCY sentences
+    synthesizing at the same time. Finished segments are handed back in
+    sentence order, including failed ones (empty audio and an error), so
+    the client can tell a gap from a missing event.
+    """
+
+    def __init__(self, voice_id: str = "ar-SA-HamedNeural"):
+        self.voice_id = voice_id
+        self.splitter = SentenceSplitter()
+        self.semaphore = asyncio.Semaphore(PIPELINED_TTS_CONCURRENCY)
+        self.pending = []  # (index, sentence, task) in sentence order
+        self.next_index = 0
+
+    async def _synthesize(self, sentence: str) -> Tuple[bytes, Optional[str]]:
+        """(audio, error); e.g. a 503 from a saturated TTS executor becomes the error"""
+        async with self.semaphore:
+            try:
+                audio = await synthesize_audio(sentence, self.voice_id, text_stream=True)
+            except HTTPException as e:
+                print(f"Pipelined TTS error: {e.detail}")
+                return b"", e.detail
+            except Exception as e:
+                print(f"Pipelined TTS error: {e}")
+                return b"", str(e) or e.__class__.__name__
+            return audio, None if audio else "No audio synthesized"
+
+    def _schedule(self, sentences: List[str]):
+        for sentence in sentences:
+            task = asyncio.create_task(self._synthesize(sentence))
+            self.pending.append((self.next_index, sentence, task))
+            self.next_index += 1
+
+    def feed(self, text: str):
+        """Queue any sentences completed by this piece of text"""
+        if text:
+            self._schedule(self.splitter.feed(text))
+
+    def ready_segments(self) -> List[dict]:
+        """Pop segments that are done, without waiting or reordering"""
+        segments = []
+        while self.pending and self.pending[0][2].done():
+            index, sentence, task = self.pending.pop(0)
+            audio, error = task.result()
+            segments.append({"segment": index, "text": sentence, "audio": audio, "error": error})
+        return segments
+
+    async def finish(self):
+        """Flush the trailing text and yield every remaining segment in order"""
+        self._schedule(self.splitter.flush())
+        while self.pending:
+            index, sentence, task = self.pending.pop(0)
+            audio, error = await task
+            yield {"segment": index, "text": sentence, "audio": audio, "error": error}
+
+    def cancel(self):
+        for _, _, task in self.pending:
+            task.cancel()
+        self.pending = []
+
+
 async def generate_audio_for_chat(message: str, voice_id: str = "ar-SA-HamedNeural") -> bytes:
     """Generate audio using simple TTS synthesis"""
     try:
-        speech_config = speechsdk.SpeechConfig(
-            subscription=subscription,
-            region="centralindia"
-        )
-        speech_config.speech_synthesis_voice_name = voice_id
-        
-        synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
-        
-        def sync_tts():
-            result = synthesizer.speak_text_async(message).get()
-            if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-                return result.audio_data
-            return b""
-        
-        loop = asyncio.get_event_loop()
-        audio_data = await loop.run_in_executor(None, sync_tts)
-        return audio_data
-        
+        return await synthesize_audio(message, voice_id)
     except Exception as e:
         print(f"TTS error: {e}")
         return b""
@@ -0,0 +1,134 @@
+import re
+from typing import List, Optional, Tuple
+
+CORRECT_TAG = "[CORRECT]"
+FINISH_TAG = "[FINISH]"
+NAME_TAG = "[NAME]"
+TAGS = (CORRECT_TAG, FINISH_TAG, NAME_TAG)
+
+
+def _partial_tag_start(text: str, tags) -> int:
+    """
+    Index where a trailing, still incomplete tag starts, or -1.
+
+    "Hello [COR" -> 6, because the next chunk may complete "[CORRECT]".
+    """
+    bracket = text.rfind("[")
+    if bracket == -1:
+        return -1
+    tail = text[bracket:]
+    if any(tag.startswith(tail) and tag != tail for tag in tags):
+        return bracket
+    return -1
+
+
+def clean_text_for_speech(text: str) -> str:
+    """Strip correction blocks, tags and markdown symbols that should not be spoken"""
+    clean_text = re.sub(r'\[CORRECT\].*?\[CORRECT\]', '', text, flags=re.DOTALL)
+    return clean_text.replace(FINISH_TAG, "").replace("*", "").replace("#", "")
+
+
+class NameTagReplacer:
+    """
+    Replaces [NAME] in streamed text chunk by chunk.
+
+    A chunk ending in a partial tag ("... [NA") is held back until the next
+    chunk shows whether it completes the tag.
+    """
+
+    def __init__(self, name: Optional[str]):
+        self.name = name
+        self.pending = ""
+
+    def feed(self, text: str) -> str:
+        if not self.name:
+            return text
+        text = self.pending + text
+        cut = _partial_tag_start(text, (NAME_TAG,))
+        if cut == -1:
+            self.pending = ""
+        else:
+            text, self.pending = text[:cut], text[cut:]
+        return text.replace(NAME_TAG, self.name)
+
+    def flush(self) -> str:
+        text, self.pending = self.pending, ""
+        return text
+
+
+class ChatTagParser:
+    """
+    Incremental parser for the [CORRECT]/[FINISH]/[NAME] tags of a bot reply.
+
+    feed() takes the newly streamed text and returns (answer_delta,
+    correction_delta): text outside [CORRECT]...[CORRECT] blocks goes to the
+    answer, text inside goes to the correction, [FINISH] is dropped and
+    [NAME] is replaced when a name is given. Tags split across chunks are
+    held back until complete, so every chunk is only scanned once.
+    """
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name
+        self.pending = ""
+        self.in_correction = False
+        self.has_correction = False
+        self.finished = False
+        self.answer_parts: List[str] = []
+        self.correction_parts: List[str] = []
+
+    def _emit(self, text: str, answer: List[str], correction: List[str]):
+        if text:
+            (correction if self.in_correction else answer).append(text)
+
+    def _parse(self, text: str, final: bool) -> Tuple[str, str]:
+        answer, correction = [], []
+        position = 0
+        while True:
+            bracket = text.find("[", position)
+            if bracket == -1:
+                self._emit(text[position:], answer, correction)
+                self.pending = ""
+                break
+            self._emit(text[position:bracket], answer, correction)
+            rest = text[bracket:]
+            tag = next((t for t in TAGS if rest.startswith(t)), None)
+            if tag == CORRECT_TAG:
+                self.in_correction = not self.in_correction
+                self.has_correction = True
+            elif tag == FINISH_TAG:
+                self.finished = True
+            elif tag == NAME_TAG:
+                self._emit(self.name or NAME_TAG, answer, correction)
+            elif not final and _partial_tag_start(rest, TAGS) == 0:
+                self.pending = rest
+                break
+            else:
+                # A bracket that is not one of our tags is plain text
+                self._emit("[", answer, correction)
+                position = bracket + 1
+                continue
+            position = bracket + len(tag)
+
+        answer_delta, correction_delta = "".join(answer), "".join(correction)
+        if answer_delta:
+            self.answer_parts.append(answer_delta)
+        if correction_delta:
+            self.correction_parts.append(correction_delta)
+        return answer_delta, correction_delta
+
+    def feed(self, text: str) -> Tuple[str, str]:
+        return self._parse(self.pending + text, final=False)
+
+    def flush(self) -> Tuple[str, str]:
+        """Release a held-back partial tag as plain text at the end of the stream"""
+        if not self.pending:
+            return "", ""
+        return self._parse(self.pending, final=True)
+
+    @property
+    def answer(self) -> str:
+        return "".join(self.answer_parts)
+
+    @property
+    def correct_answer(self) -> str:
+        return "".join(self.correction_parts)
@@ -0,0 +1,235 @@
+import hashlib
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# Format of everything the synthesizers produce (SDK default); part of the cache key
+OUTPUT_FORMAT = "riff-24khz-16bit-mono-pcm"
+
+
+def normalize_text(text: str) -> str:
+    """Whitespace differences do not change the audio, so they do not change the key"""
+    return " ".join(text.split())
+
+
+def cache_key(voice_id: str, text: str, output_format: str = OUTPUT_FORMAT) -> str:
+    raw = f"{voice_id}\n{output_format}\n{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """
+    Content-addressed cache of synthesized audio.
+
+    Keyed by (voice, output format, normalized text). A bounded in-memory LRU
+    sits in front of a directory of audio files; disk hits are read through
+    mmap and promoted to memory. Files are written atomically, so several
+    workers can share one directory.
+
+    The directory is capped at disk_bytes: once a worker's running total
+    passes it, the directory is rescanned and the least recently used files
+    (disk hits refresh the mtime) are removed down to 90% of the cap.
+    """
+
+    def __init__(self, directory: Optional[str], memory_bytes: int, disk_bytes: int = 1024 ** 3):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self.memory_used = 0
+        self.disk_used = 0
+        self.lock = threading.Lock()
+        self.prune_lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "pruned_files": 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.disk_used = sum(size for _, _, size in self._files())
+
+    @classmethod
+    def from_env(cls) -> "AudioCache":
+        return cls(
+            directory=os.getenv("TTS_CACHE_DIR", ".tts_cache") or None,
+            memory_bytes=int(float(os.getenv("TTS_CACHE_MEMORY_MB", "64")) * 1024 * 1024),
+            disk_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", str(1024 ** 3)))
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.wav")
+
+    def _remember(self, key: str, audio: bytes):
+        """Add to the memory tier; caller holds the lock"""
+        if len(audio) > self.memory_bytes:
+            return
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return
+        self.memory[key] = audio
+        self.memory_used += len(audio)
+        while self.memory_used > self.memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_used -= len(evicted)
+
+    def get_memory(self, voice_id: str, text: str) -> Optional[bytes]:
+        """Memory tier only; cheap enough to call from the event loop"""
+        key = cache_key(voice_id, text)
+        with self.lock:
+            audio = self.memory.get(key)
+            if audio is not None:
+                self.memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+            return audio
+
+    def get(self, voice_id: str, text: str) -> Optional[bytes]:
+        """Memory, then disk; blocking, so call it off the event loop"""
+        audio = self.get_memory(voice_id, text)
+        if audio is not None:
+            return audio
+
+        if self.directory:
+            key = cache_key(voice_id, text)
+            try:
+                with open(self._path(key), "rb") as f:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        audio = bytes(mapped)
+                try:
+                    # mtime is the recency pruning goes by
+                    os.utime(self._path(key))
+                except OSError:
+                    pass
+                with self.lock:
+                    self.counters["disk_hits"] += 1
+                    self._remember(key, audio)
+                return audio
+            except (FileNotFoundError, ValueError):
+                # ValueError: empty file left by an interrupted write
+                pass
+
+        with self.lock:
+            self.counters["misses"] += 1
+        return None
+
+    def put(self, voice_id: str, text: str, audio: bytes):
+        if not audio:
+            return
+        key = cache_key(voice_id, text)
+        with self.lock:
+            self.counters["stores"] += 1
+            self._remember(key, audio)
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(audio)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error writing TTS cache file: {e}")
+            return
+        with self.lock:
+            self.disk_used += len(audio)
+            over = self.disk_used > self.disk_bytes
+        if over:
+            self.prune()
+
+    def _files(self):
+        """(mtime, path, size) of every cached audio file"""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".wav"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, path, stat.st_size))
+        return files
+
+    def prune(self):
+        """Remove least recently used files until the directory is under 90% of disk_bytes; blocking"""
+        if not self.directory or not self.prune_lock.acquire(blocking=False):
+            return
+        try:
+            files = sorted(self._files())
+            used = sum(size for _, _, size in files)
+            target = self.disk_bytes * 0.9
+            removed = 0
+            for _, path, size in files:
+                if used <= target:
+                    break
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    # Another worker pruned it
+                    pass
+                used -= size
+            with self.lock:
+                # Other workers write here too; the scan is the real total
+                self.disk_used = used
+                self.counters["pruned_files"] += removed
+        finally:
+            self.prune_lock.release()
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = sum(self.counters[k] for k in ("memory_hits", "disk_hits", "misses"))
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            return {
+                **self.counters,
+                "hit_ratio": hits / lookups if lookups else 0,
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory_used,
+                "memory_limit_bytes": self.memory_bytes,
+                "disk_bytes": self.disk_used,
+                "disk_limit_bytes": self.disk_bytes,
+                "directory": self.directory
+            }
+
+
+async def prewarm(voice_ids):
+    """Synthesize every opening line of every active bot into the cache"""
+    from dotenv import load_dotenv
+    load_dotenv(".env")
+    from mongo import MongoDB
+    from speech import SentenceSplitter, synthesize_audio
+    from stream_tags import NAME_TAG, clean_text_for_speech
+
+    db = MongoDB(os.getenv("MONGO_URL"), os.getenv("DATABASE_NAME"))
+    configs = await db.bot_configs.find({"is_active": True}, {"bot_description": 1, "opening_lines": 1}).to_list(length=None)
+
+    lines = set()
+    for config in configs:
+        for line in config.get("opening_lines") or []:
+            if NAME_TAG in line:
+                # Personalised per user; nothing to share
+                continue
+            spoken = clean_text_for_speech(line).strip()
+            if not spoken:
+                continue
+            # Full-reply TTS speaks the whole line; pipelined TTS speaks it sentence by sentence
+            lines.add(spoken)
+            splitter = SentenceSplitter()
+            lines.update(splitter.feed(spoken) + splitter.flush())
+
+    for voice_id in voice_ids:
+        for line in sorted(lines):
+            await synthesize_audio(line, voice_id)
+        print(f"Pre-warmed {len(lines)} lines for {voice_id}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="Pre-warm the TTS audio cache with bot opening lines")
+    parser.add_argument("command", choices=["prewarm"])
+    parser.add_argument("--voices", default=os.getenv("TTS_WARM_VOICES", "ar-SA-HamedNeural"),
+                        help="comma separated voice ids")
+    args = parser.parse_args()
+    asyncio.run(prewarm([v.strip() for v in args.voices.split(",") if v.strip()]))